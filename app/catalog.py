@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models, schemas
+from app.scheduling import FrequencyRule, frequency_rule
+
+# Страховка для нескольких воркеров: чужой процесс мог пересеять каталог
+CATALOG_REFRESH_SECONDS = float(os.getenv("CATALOG_REFRESH_SECONDS", "300"))
+# specific_injury приходит от клиента: запоминаем совпадения только для последних значений
+SPECIFIC_MATCHES_CACHE_SIZE = int(os.getenv("SPECIFIC_MATCHES_CACHE_SIZE", "256"))
+
+_exercise_list = TypeAdapter(List[schemas.ExerciseOut])
+
+
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+_EMPTY_LIST = (b"[]", _etag(b"[]"))
+
+
+class CatalogSnapshot:
+    """Неизменяемый снимок каталога упражнений с индексами по травмам"""
+
+    def __init__(self, version: int, exercises: Sequence[schemas.ExerciseOut]):
+        self.version = version
+        self.loaded_at = time.time()
+        # Меняется только вместе с содержимым каталога (см. ExerciseCatalog.load)
+        self.last_modified = int(self.loaded_at)
+        self.exercises: Tuple[schemas.ExerciseOut, ...] = tuple(exercises)
+        self.list_body = _exercise_list.dump_json(list(self.exercises))
+        self.checksum = hashlib.sha256(self.list_body).hexdigest()
+        # Готовые JSON-ответы и их ETag: ключ -> (тело, etag)
+        self._representations: Dict[tuple, Tuple[bytes, str]] = {("list",): (self.list_body, _etag(self.list_body))}
+        self.by_id: Dict[int, schemas.ExerciseOut] = {exercise.id: exercise for exercise in self.exercises}
+        # Правила частоты, собранные один раз на снимок: генерация плана читает только их
+        self.frequency_rules: Dict[int, FrequencyRule] = {
+            exercise.id: frequency_rule(exercise) for exercise in self.exercises
+        }
+
+        # Вид травмы (регистр не важен) -> id упражнений
+        by_injury: Dict[str, List[int]] = {}
+        # Значение из suitable_for как есть -> id упражнений
+        by_specific: Dict[str, List[int]] = {}
+        for exercise in self.exercises:
+            for item in exercise.suitable_for or []:
+                by_injury.setdefault(item.lower(), []).append(exercise.id)
+                by_specific.setdefault(str(item), []).append(exercise.id)
+        self.by_injury: Dict[str, Tuple[int, ...]] = {key: tuple(dict.fromkeys(ids)) for key, ids in by_injury.items()}
+        self.by_specific: Dict[str, Tuple[int, ...]] = {key: tuple(dict.fromkeys(ids)) for key, ids in by_specific.items()}
+        self._specific_matches: "OrderedDict[str, Tuple[int, ...]]" = OrderedDict()
+
+    def get(self, exercise_id: int) -> Optional[schemas.ExerciseOut]:
+        return self.by_id.get(exercise_id)
+
+    def _resolve(self, ids: Sequence[int]) -> List[schemas.ExerciseOut]:
+        return [self.by_id[exercise_id] for exercise_id in ids]
+
+    def for_injury_type(self, injury_type: str) -> List[schemas.ExerciseOut]:
+        """Точное совпадение с элементом suitable_for без учёта регистра"""
+        return self._resolve(self.by_injury.get(injury_type.lower(), ()))
+
+    def _representation(self, key: tuple, encode: Callable[[], bytes]) -> Tuple[bytes, str]:
+        representation = self._representations.get(key)
+        if representation is None:
+            body = encode()
+            representation = (body, _etag(body))
+            self._representations[key] = representation
+        return representation
+
+    def list_representation(self) -> Tuple[bytes, str]:
+        return self._representations[("list",)]
+
+    def injury_representation(self, injury_type: str) -> Tuple[bytes, str]:
+        key = injury_type.lower()
+        if key not in self.by_injury:
+            # Кэшируем только известные виды травм: ключи приходят от клиента без авторизации
+            return _EMPTY_LIST
+        return self._representation(("injury", key), lambda: _exercise_list.dump_json(self.for_injury_type(key)))
+
+    def item_representation(self, exercise_id: int) -> Optional[Tuple[bytes, str]]:
+        exercise = self.by_id.get(exercise_id)
+        if exercise is None:
+            return None
+        return self._representation(("item", exercise_id), lambda: exercise.model_dump_json().encode("utf-8"))
+
+    def for_specific_injury(self, specific_injury: str) -> List[schemas.ExerciseOut]:
+        """specific_injury как подстрока элемента suitable_for (как при генерации расписания)"""
+        ids = self._specific_matches.get(specific_injury)
+        if ids is not None:
+            self._specific_matches.move_to_end(specific_injury)
+            return self._resolve(ids)
+        matched = set()
+        for item, item_ids in self.by_specific.items():
+            if specific_injury in item:
+                matched.update(item_ids)
+        ids = tuple(exercise.id for exercise in self.exercises if exercise.id in matched)
+        if SPECIFIC_MATCHES_CACHE_SIZE > 0:
+            self._specific_matches[specific_injury] = ids
+            while len(self._specific_matches) > SPECIFIC_MATCHES_CACHE_SIZE:
+                self._specific_matches.popitem(last=False)
+        return self._resolve(ids)
+
+
+class ExerciseCatalog:
+    """Каталог упражнений в памяти процесса"""
+
+    def __init__(self, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._stale = True
+        self._version = 0
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _is_fresh(self) -> bool:
+        if self._snapshot is None or self._stale:
+            return False
+        if self.refresh_seconds > 0 and time.time() - self._snapshot.loaded_at > self.refresh_seconds:
+            return False
+        return True
+
+    def invalidate(self) -> None:
+        """Следующий запрос перечитает каталог из БД"""
+        self._stale = True
+
+    async def load(self, db: AsyncSession) -> CatalogSnapshot:
+        result = await db.execute(select(models.Exercise).order_by(models.Exercise.id))
+        exercises = [schemas.ExerciseOut.model_validate(row) for row in result.scalars().all()]
+        snapshot = CatalogSnapshot(self._version + 1, exercises)
+        previous = self._snapshot
+        if previous is not None and previous.checksum == snapshot.checksum:
+            # Содержимое не изменилось: сохраняем версию, ETag и Last-Modified
+            previous.loaded_at = snapshot.loaded_at
+        else:
+            self._version = snapshot.version
+            self._snapshot = snapshot
+        self._stale = False
+        return self._snapshot
+
+    async def get(self, db: AsyncSession) -> CatalogSnapshot:
+        if self._is_fresh():
+            return self._snapshot
+        # Создаём лениво: в Python 3.9 Lock привязывается к текущему циклу
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._is_fresh():
+                return self._snapshot
+            return await self.load(db)
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "loaded": snapshot is not None,
+            "stale": self._stale,
+            "version": snapshot.version if snapshot else None,
+            "checksum": snapshot.checksum if snapshot else None,
+            "exercises": len(snapshot.exercises) if snapshot else 0,
+            "injury_keys": len(snapshot.by_injury) if snapshot else 0,
+            "loaded_at": snapshot.loaded_at if snapshot else None,
+        }
+
+
+exercise_catalog = ExerciseCatalog(CATALOG_REFRESH_SECONDS)
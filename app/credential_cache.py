@@ -0,0 +1,108 @@
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Set, Tuple
+
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "300"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "1024"))
+
+
+class VerifiedCredentialCache:
+    """Кэш недавно проверенных пар логин/пароль.
+
+    Ключ - HMAC от логина и пароля на случайном ключе процесса, поэтому
+    открытый пароль в памяти не хранится. Значение - хеш пароля, с которым
+    прошла проверка: если хеш в базе изменился, запись считается устаревшей.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._key = secrets.token_bytes(32)
+        self._entries: "OrderedDict[bytes, Tuple[str, str, float]]" = OrderedDict()
+        self._by_username: Dict[str, Set[bytes]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def _digest(self, username: str, password: str) -> bytes:
+        message = f"{len(username)}:{username}{password}".encode("utf-8")
+        return hmac.new(self._key, message, hashlib.sha256).digest()
+
+    def _remove(self, digest: bytes) -> None:
+        username, _, _ = self._entries.pop(digest)
+        keys = self._by_username.get(username)
+        if keys is not None:
+            keys.discard(digest)
+            if not keys:
+                del self._by_username[username]
+
+    def lookup(self, username: str, password: str, current_hash: str) -> bool:
+        """True, если пара уже проверялась против текущего хеша пароля"""
+        if not self.enabled:
+            return False
+        digest = self._digest(username, password)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                _, verified_hash, expires_at = entry
+                if expires_at > now and hmac.compare_digest(verified_hash, current_hash):
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+                    return True
+                self._remove(digest)
+            self.misses += 1
+            return False
+
+    def store(self, username: str, password: str, verified_hash: str) -> None:
+        if not self.enabled:
+            return
+        digest = self._digest(username, password)
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            if digest in self._entries:
+                self._remove(digest)
+            self._entries[digest] = (username, verified_hash, expires_at)
+            self._by_username.setdefault(username, set()).add(digest)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate_user(self, username: str) -> None:
+        """Удаляет все записи пользователя (например, после смены пароля)"""
+        with self._lock:
+            for digest in list(self._by_username.get(username, ())):
+                self._remove(digest)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_username.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
+
+
+credential_cache = VerifiedCredentialCache(AUTH_CACHE_TTL_SECONDS, AUTH_CACHE_MAX_ENTRIES)
@@ -1,30 +1,280 @@
-from sqlalchemy import create_engine, MetaData
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from sqlalchemy import and_, delete, event, exc, exists, false, func, insert, inspect, or_, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.schema import CreateColumn, CreateIndex, CreateTable
+from app import query_profiler
+from app.metrics import instrument_engine
 
-DATABASE_URL = "sqlite:///./test.db"
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Настройки пула: размер подбирается под число воркеров и потоков
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+
+# Профиль SQLite: "default" - настройки драйвера, "production" - WAL и прагмы ниже
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "default")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# Пишущие эндпоинты процесса выстраиваются в одну очередь вместо борьбы за блокировку
+SQLITE_SINGLE_WRITER = os.getenv("SQLITE_SINGLE_WRITER", "false").lower() in ("1", "true", "yes")
+
+logger = logging.getLogger(__name__)
+
+def to_async_url(url: str) -> str:
+    """sqlite:// -> sqlite+aiosqlite://, postgresql:// -> postgresql+asyncpg://"""
+    scheme, sep, rest = url.partition("://")
+    dialect = scheme.split("+", 1)[0]
+    if dialect == "sqlite":
+        return f"sqlite+aiosqlite{sep}{rest}"
+    if dialect in ("postgres", "postgresql"):
+        return f"postgresql+asyncpg{sep}{rest}"
+    return url
+
+ASYNC_DATABASE_URL = to_async_url(DATABASE_URL)
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Пул, который считает, сколько запросы ждут свободного соединения"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            self.checkouts += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+# SQLAlchemy пишет события пула в логгер по имени класса пула, а он оказался внутри "app"
+logging.getLogger(f"{__name__}.{InstrumentedQueuePool.__name__}").setLevel(logging.WARNING)
+
+def engine_options(url: str) -> dict:
+    """Параметры create_async_engine для указанного URL"""
+    url = make_url(url)
+    options = {}
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # Базе в памяти нужен один общий коннект, пул для неё не настраиваем
+        return options
+
+    options.update(
+        poolclass=InstrumentedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+    if DB_STATEMENT_TIMEOUT_MS > 0 and url.get_backend_name() == "postgresql":
+        options["connect_args"] = {
+            "server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+        }
+    return options
+
+def sqlite_pragmas(profile: str) -> List[str]:
+    if profile != "production":
+        return []
+    return [
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}",
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in sqlite_pragmas(SQLITE_PROFILE):
+        cursor.execute(pragma)
+    cursor.close()
+
+engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL))
+if engine.dialect.name == "sqlite":
+    event.listen(engine.sync_engine, "connect", _apply_sqlite_pragmas)
+instrument_engine(engine.sync_engine)
+query_profiler.instrument_engine(engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
-def init_db():
+def dialect_insert(model):
+    """INSERT с поддержкой ON CONFLICT для текущего диалекта (sqlite/postgresql)"""
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+def pool_stats() -> dict:
+    pool = engine.pool
+    stats = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=max(0, pool.overflow()),
+            max_overflow=DB_MAX_OVERFLOW,
+            timeout_seconds=DB_POOL_TIMEOUT,
+        )
+    if isinstance(pool, InstrumentedQueuePool):
+        stats.update(
+            checkouts=pool.checkouts,
+            timeouts=pool.timeouts,
+            avg_wait_ms=pool.wait_seconds_total / pool.checkouts * 1000 if pool.checkouts else 0.0,
+            max_wait_ms=pool.wait_seconds_max * 1000,
+        )
+    return stats
+
+def add_missing_columns(connection):
+    """create_all не добавляет новые колонки в уже существующие таблицы.
+    Добавляются только колонки, допускающие NULL или со server_default."""
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable and column.server_default is None:
+                raise RuntimeError(f"Cannot add NOT NULL column {table.name}.{column.name} without server_default")
+            ddl = CreateColumn(column).compile(dialect=connection.dialect)
+            connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+
+def create_missing_indexes(connection):
+    """create_all не добавляет новые индексы в уже существующие таблицы"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+def schema_checksum(dialect) -> str:
+    """Контрольная сумма DDL всех таблиц и индексов моделей"""
+    statements = []
+    for table in Base.metadata.sorted_tables:
+        statements.append(str(CreateTable(table).compile(dialect=dialect)))
+        statements.extend(str(CreateIndex(index).compile(dialect=dialect)) for index in table.indexes)
+    return hashlib.sha256("\n".join(sorted(statements)).encode("utf-8")).hexdigest()
+
+def dedupe_training_slots(connection) -> int:
+    """Дубли слотов (schedule_id, date, exercise_id) не дают создать ux_trainings_slot.
+    Остаётся выполненная строка, при равенстве - с меньшим id; удалённые получают tombstone."""
     from app import models
+    inspector = inspect(connection)
+    if "trainings" not in inspector.get_table_names():
+        return 0
+    if any(index["name"] == "ux_trainings_slot" for index in inspector.get_indexes("trainings")):
+        return 0
+    trainings = models.Training.__table__
+    other = trainings.alias("other")
+    completed = func.coalesce(trainings.c.is_completed, false())
+    other_completed = func.coalesce(other.c.is_completed, false())
+    duplicate = exists().where(
+        other.c.schedule_id == trainings.c.schedule_id,
+        other.c.date == trainings.c.date,
+        other.c.exercise_id == trainings.c.exercise_id,
+        or_(other_completed > completed, and_(other_completed == completed, other.c.id < trainings.c.id)),
+    )
+    rows = connection.execute(
+        select(trainings.c.id, models.TrainingSchedule.user_id)
+        .join(models.TrainingSchedule, trainings.c.schedule_id == models.TrainingSchedule.id)
+        .where(duplicate)
+    ).all()
+    if not rows:
+        return 0
+    connection.execute(delete(trainings).where(duplicate))
+    connection.execute(insert(models.SyncTombstone), [
+        {"user_id": row.user_id, "entity": "training", "entity_id": row.id} for row in rows
+    ])
+    logger.warning("Removed duplicate training slots", extra={"removed": len(rows)})
+    return len(rows)
+
+def apply_schema(connection) -> int:
+    """Возвращает число удалённых дублей тренировок: после них агрегаты пересчитываются"""
+    Base.metadata.create_all(connection)
+    add_missing_columns(connection)
+    removed = dedupe_training_slots(connection)
+    create_missing_indexes(connection)
+    return removed
+
+async def init_db():
+    """Схема и начальные данные. Когда контрольные суммы совпадают с сохранёнными
+    в seed_state, это два SELECT без DDL и без чтения каталога."""
+    from app import models, seed_state
     from app.exercise_init import init_db as init_db_data
-    models.Base.metadata.create_all(bind=engine)
-
-    db = SessionLocal()
-    try:
-        init_db_data(db)
-    except Exception as e:
-        print(f"Exception db init: {e}")
-        raise
-    finally:
-        db.close()
-
-def get_db():
-    db = SessionLocal()
-    try:
+    from app.progress import backfill_if_empty, rebuild
+    async with engine.begin() as conn:
+        await conn.run_sync(models.SeedState.__table__.create, checkfirst=True)
+        checksum = schema_checksum(conn.dialect)
+        schema_changed = False
+        removed_duplicates = 0
+        if await seed_state.read_checksum(conn, seed_state.SCHEMA) != checksum:
+            await seed_state.claim(conn, seed_state.SCHEMA)
+            if await seed_state.read_checksum(conn, seed_state.SCHEMA) != checksum:
+                removed_duplicates = await conn.run_sync(apply_schema)
+                await seed_state.store(conn, seed_state.SCHEMA, checksum)
+                schema_changed = True
+                logger.info("Database schema updated")
+
+    async with AsyncSessionLocal() as db:
+        try:
+            await init_db_data(db)
+            if removed_duplicates:
+                # Удалённые дубли уже были учтены в агрегатах
+                await rebuild(db)
+                await db.commit()
+            elif schema_changed:
+                # Новые таблицы агрегатов заполняются по уже накопленным данным
+                await backfill_if_empty(db)
+        except Exception:
+            logger.exception("Exception db init")
+            raise
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
+
+_writer_lock: Optional[asyncio.Lock] = None
+
+@asynccontextmanager
+async def writer_slot():
+    """Очередь записи SQLite внутри процесса (только при SQLITE_SINGLE_WRITER)"""
+    global _writer_lock
+    if not SQLITE_SINGLE_WRITER or engine.dialect.name != "sqlite":
+        yield
+        return
+    # Создаём лениво: в Python 3.9 Lock привязывается к текущему циклу
+    if _writer_lock is None:
+        _writer_lock = asyncio.Lock()
+    async with _writer_lock:
+        yield
+
+async def get_write_db():
+    """Сессия для эндпоинтов, которые пишут в БД"""
+    async with writer_slot():
+        async with AsyncSessionLocal() as db:
+            yield db
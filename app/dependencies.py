@@ -1,26 +1,29 @@
+from dataclasses import dataclass
+from typing import Optional
 from fastapi import Depends, HTTPException, status
-from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from sqlalchemy.orm import Session
-import bcrypt
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBasic, HTTPBasicCredentials, HTTPBearer
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_db
-from app import models
+from app import models, tokens
+from app.credential_cache import credential_cache
+from app.passwords import verify_password
 
 security = HTTPBasic()
+optional_basic = HTTPBasic(auto_error=False)
+optional_bearer = HTTPBearer(auto_error=False)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Проверка пароля с помощью прямой библиотеки bcrypt"""
-    try:
-        plain_bytes = plain_password.encode('utf-8')
-        hashed_bytes = hashed_password.encode('utf-8')
-        return bcrypt.checkpw(plain_bytes, hashed_bytes)
-    except Exception as e:
-        print(f"Password verification error: {e}")
-        return False
-
-def authenticate(credentials: HTTPBasicCredentials, db: Session):
-    user = db.query(models.User).filter(
+@dataclass(frozen=True)
+class AuthenticatedUser:
+    """Пользователь текущего запроса без привязки к сессии БД"""
+    id: int
+    username: str
+
+async def authenticate(credentials: HTTPBasicCredentials, db: AsyncSession):
+    result = await db.execute(select(models.User).where(
         models.User.username == credentials.username
-    ).first()
+    ))
+    user = result.scalars().first()
     
     if not user:
         raise HTTPException(
@@ -29,14 +32,57 @@ def authenticate(credentials: HTTPBasicCredentials, db: Session):
             headers={"WWW-Authenticate": "Basic"},
         )
     
+    # Пара уже проверялась против текущего хеша - bcrypt не нужен
+    if credential_cache.lookup(credentials.username, credentials.password, user.password):
+        return user
+
     # Используем прямую проверку bcrypt
-    if not verify_password(credentials.password, user.password):
+    if not await verify_password(credentials.password, user.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials",
             headers={"WWW-Authenticate": "Basic"},
         )
+    credential_cache.store(credentials.username, credentials.password, user.password)
     return user
 
-def get_current_user(credentials: HTTPBasicCredentials = Depends(security), db: Session = Depends(get_db)):
-    return authenticate(credentials, db)
\ No newline at end of file
+async def get_current_user(credentials: HTTPBasicCredentials = Depends(security), db: AsyncSession = Depends(get_db)):
+    return await authenticate(credentials, db)
+
+def _user_from_token(token: str) -> AuthenticatedUser:
+    try:
+        claims = tokens.decode_token(token, tokens.ACCESS)
+    except tokens.TokenError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return AuthenticatedUser(id=claims["sub"], username=claims["usr"])
+
+async def get_token_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_bearer)):
+    """Только Bearer: одна проверка HMAC, без запроса в БД"""
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return _user_from_token(credentials.credentials)
+
+async def get_authenticated_user(
+    bearer: Optional[HTTPAuthorizationCredentials] = Depends(optional_bearer),
+    basic: Optional[HTTPBasicCredentials] = Depends(optional_basic),
+    db: AsyncSession = Depends(get_db)
+):
+    """Bearer-токен, а для старых клиентов - HTTP Basic"""
+    if bearer is not None:
+        return _user_from_token(bearer.credentials)
+    if basic is not None:
+        user = await authenticate(basic, db)
+        return AuthenticatedUser(id=user.id, username=user.username)
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Not authenticated",
+        headers={"WWW-Authenticate": "Bearer, Basic"},
+    )
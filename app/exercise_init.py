@@ -1,4 +1,10 @@
-from sqlalchemy.orm import Session
+import asyncio
+import logging
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.catalog import exercise_catalog
+
+logger = logging.getLogger(__name__)
 
 initial_exercises = [
     {
@@ -10,6 +16,8 @@ initial_exercises = [
         },
         "suitable_for": ["Перелом конечностей", "Эндопротезирование сустава"],
         "max_pain_level": 3,
+        "times_per_day": 3,
+        "days_per_week": 7,
         "steps": [
             "Напрягите мышцы конечности на 5-7 секунд",
             "Расслабьтесь на 10 секунд",
@@ -27,6 +35,8 @@ initial_exercises = [
         },
         "suitable_for": ["Инсульт", "Черепно-мозговая травма"],
         "max_pain_level": 2,
+        "times_per_day": 2,
+        "days_per_week": 5,
         "steps": [
             "Перекрестные движения рук и ног",
             "Зеркальное рисование обеими руками",
@@ -40,6 +50,8 @@ initial_exercises = [
         "general_description": "Восстановление подвижности после иммобилизации",
         "suitable_for": ["Разрыв связок", "Эндопротезирование сустава"],
         "max_pain_level": 4,
+        "times_per_day": 2,
+        "days_per_week": 6,
         "steps": [
             "Медленные сгибания/разгибания в суставе с помощью инструктора или здоровой конечности",
             "По 10 повторений в каждом направлении",
@@ -53,6 +65,8 @@ initial_exercises = [
         "general_description": "Профилактика осложнений после операции на позвоночнике. Помощь при восстановлении после инсульта",
         "suitable_for": ["Операция на позвоночнике", "Инсульт"],
         "max_pain_level": 2,
+        "times_per_day": 5,
+        "days_per_week": 7,
         "steps": [
             "Глубокий вдох через нос в течении 4 секунд",
             "Медленный выдох через рот в течении 6 секунд",
@@ -66,6 +80,8 @@ initial_exercises = [
         "general_description": "Восстановление после инсульта",
         "suitable_for": ["Инсульт"],
         "max_pain_level": 3,
+        "times_per_day": 2,
+        "days_per_week": 7,
         "steps": [
             "Собирание мелких предметов пальцами",
             "Рисование на песке",
@@ -80,6 +96,8 @@ initial_exercises = [
         "general_description": "Восстановление после разрыва",
         "suitable_for": ["Разрыв ахиллова сухожилия"],
         "max_pain_level": 5,
+        "times_per_day": 1,
+        "days_per_week": 3,
         "steps": [
             "Встаньте лицом к стене, руки на груди",
             "Больню ногу оставить назад",
@@ -94,6 +112,8 @@ initial_exercises = [
         "general_description": "После вывиха плеча",
         "suitable_for": ["Вывих плеча"],
         "max_pain_level": 4,
+        "times_per_day": 2,
+        "days_per_week": 4,
         "steps": [
             "Использование эластичной ленты",
             "Наружная и внутренняя ротация плеча",
@@ -107,6 +127,8 @@ initial_exercises = [
         "general_description": "После кесарева сечения",
         "suitable_for": ["Кесарево сечение"],
         "max_pain_level": 3,
+        "times_per_day": 3,
+        "days_per_week": 5,
         "steps": [
             "Лежа на спине с согнутыми коленями, медленно напрягайте мышцы тазового дна",
             "Удерживайте напряжение 5 seconds, 10 повторений",
@@ -120,6 +142,8 @@ initial_exercises = [
         "general_description": "После абдоминальных операций",
         "suitable_for": ["Аппендэктомия", "Лапароскопические операции"],
         "max_pain_level": 2,
+        "times_per_day": 4,
+        "days_per_week": 7,
         "steps": [
             "Используйте дыхательный тренажер",
             "Медленный вдох через сопротивление",
@@ -134,6 +158,8 @@ initial_exercises = [
         "general_description": "Помощь при артрите",
         "suitable_for": ["Артрит"],
         "max_pain_level": 3,
+        "times_per_day": 1,
+        "days_per_week": 3,
         "steps": [
             "Легкие упражнения в бассейне",
             "Медленные махи ногами",
@@ -148,6 +174,8 @@ initial_exercises = [
         "general_description": "При рассеяннос склерозе",
         "suitable_for": ["Рассеянный склероз"],
         "max_pain_level": 2,
+        "times_per_day": 2,
+        "days_per_week": 5,
         "steps": [
             "Встаньте у опоры",
             "Перенос веса тела с ноги на ногу",
@@ -158,22 +186,43 @@ initial_exercises = [
         "image_url": "https://i.pinimg.com/originals/3b/1d/cb/3b1dcbdb6afa51ca53a25f0706a6983e.jpg"
     }
 ]
-def init_db(db: Session):
-    from app import models
+async def init_db(db: AsyncSession):
+    """Досевает изменения initial_exercises: новые упражнения добавляются, изменённые
+    обновляются (сопоставление по title). Удалённые из списка не трогаем - на них
+    могут ссылаться тренировки."""
+    from app import models, seed_state
 
-    if db.query(models.Exercise).count() > 0:
+    checksum = seed_state.data_checksum(initial_exercises)
+    if await seed_state.read_checksum(db, seed_state.EXERCISES) == checksum:
+        return
+    await seed_state.claim(db, seed_state.EXERCISES)
+    if await seed_state.read_checksum(db, seed_state.EXERCISES) == checksum:
+        await db.commit()
         return
+
+    existing = {exercise.title: exercise for exercise in (await db.execute(select(models.Exercise))).scalars()}
+    added = updated = 0
     for exercise_data in initial_exercises:
-        db_exercise = models.Exercise(**exercise_data)
-        db.add(db_exercise)
+        exercise = existing.get(exercise_data["title"])
+        if exercise is None:
+            db.add(models.Exercise(**exercise_data))
+            added += 1
+            continue
+        changed = {key: value for key, value in exercise_data.items() if getattr(exercise, key) != value}
+        for key, value in changed.items():
+            setattr(exercise, key, value)
+        updated += bool(changed)
 
-    db.commit()
+    await seed_state.store(db, seed_state.EXERCISES, checksum)
+    await db.commit()
+    logger.info("Exercise seed applied", extra={"added": added, "updated": updated})
+    if added or updated:
+        exercise_catalog.invalidate()
 
-if __name__ == "__main__":
-    from app.database import SessionLocal
-    db = SessionLocal()
-    try:
-        init_db(db)
-    finally:
-        db.close()
+async def main():
+    from app.database import engine, init_db as init_database
+    await init_database()
+    await engine.dispose()
 
+if __name__ == "__main__":
+    asyncio.run(main())
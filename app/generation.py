@@ -0,0 +1,381 @@
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from fastapi import HTTPException, status
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app import models
+from app.catalog import exercise_catalog
+from app.database import AsyncSessionLocal, writer_slot
+from app.logging_config import request_id_var
+from app.progress import ProgressDelta
+from app.scheduling import PLAN_DAYS, insert_trainings, plan_rules, plan_templates, stamp_template
+
+SCHEDULE_JOB_WORKERS = int(os.getenv("SCHEDULE_JOB_WORKERS", "2"))
+# Задания в очереди процесса; сверх этого POST получает 503
+SCHEDULE_JOB_MAX_PENDING = int(os.getenv("SCHEDULE_JOB_MAX_PENDING", "100"))
+SCHEDULE_JOB_MAX_ATTEMPTS = int(os.getenv("SCHEDULE_JOB_MAX_ATTEMPTS", "3"))
+SCHEDULE_JOB_RETRY_DELAY = float(os.getenv("SCHEDULE_JOB_RETRY_DELAY", "1"))
+# Задание queued/running, не менявшее статус дольше этого, брошено упавшим процессом
+SCHEDULE_JOB_STALE_SECONDS = float(os.getenv("SCHEDULE_JOB_STALE_SECONDS", "120"))
+
+ProgressCallback = Callable[[float], None]
+# Вызывается в транзакции генерации перед commit, когда id расписания уже известен
+BeforeCommit = Callable[[AsyncSession, models.TrainingSchedule], Awaitable[None]]
+
+logger = logging.getLogger(__name__)
+
+
+def _no_progress(value: float) -> None:
+    pass
+
+
+async def create_schedule(
+    db: AsyncSession,
+    user_id: int,
+    questionnaire_id: int,
+    mode: str,
+    on_progress: ProgressCallback = _no_progress,
+    before_commit: Optional[BeforeCommit] = None,
+) -> models.TrainingSchedule:
+    """Генерация и сохранение расписания по анкете пользователя в одной транзакции"""
+    # Проверяем анкету
+    result = await db.execute(select(models.Questionnaire).where(
+        models.Questionnaire.id == questionnaire_id,
+        models.Questionnaire.user_id == user_id
+    ))
+    questionnaire = result.scalars().first()
+    if not questionnaire:
+        raise HTTPException(status_code=404, detail="Анкета не найдена")
+
+    # Упражнения по specific_injury из каталога в памяти
+    catalog = await exercise_catalog.get(db)
+    exercises = catalog.for_specific_injury(questionnaire.specific_injury)
+
+    logger.debug(
+        "Подходящих упражнений: %d",
+        len(exercises),
+        extra={"questionnaire_id": questionnaire_id, "specific_injury": questionnaire.specific_injury},
+    )
+    if not exercises:
+        raise HTTPException(status_code=404, detail="Нет подходящих упражнений")
+
+    # Создаем расписание
+    start_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    schedule = models.TrainingSchedule(
+        user_id=user_id,
+        questionnaire_id=questionnaire.id,
+        injury_type=questionnaire.main_injury_type,
+        specific_injury=questionnaire.specific_injury,
+        mode=mode,
+        start_date=start_date,
+        plan_days=PLAN_DAYS
+    )
+    rules = plan_rules(exercises, catalog.frequency_rules)
+    # Шаблон общий для всех с той же травмой и тем же рисунком дат
+    template = plan_templates.get(questionnaire.specific_injury, catalog.version, rules, start_date, PLAN_DAYS)
+    delta = ProgressDelta()
+    for offset, _, _ in template:
+        delta.add(user_id, start_date + timedelta(days=offset), trainings_planned=1)
+
+    if mode == "compact":
+        # Храним только правила; тренировки разворачиваются в GET /{schedule_id}/plan
+        schedule.plan_rules = rules
+        db.add(schedule)
+        await delta.apply(db)
+        if before_commit is not None:
+            await db.flush()
+            await before_commit(db, schedule)
+        await db.commit()
+        set_committed_value(schedule, "trainings", [])
+        return schedule
+
+    db.add(schedule)
+    await db.flush()
+
+    # Тренировки на 84 дня по шаблону, одним пакетным INSERT
+    rows = stamp_template(template, schedule.id, start_date)
+    on_progress(0.5)
+    trainings = await insert_trainings(db, rows)
+    await delta.apply(db)
+    if before_commit is not None:
+        await before_commit(db, schedule)
+    await db.commit()
+
+    set_committed_value(schedule, "trainings", trainings)
+    return schedule
+
+
+class _JobLost(Exception):
+    """Задание забрал другой процесс, пока это выполнение генерировало расписание"""
+
+
+class ScheduleJobRunner:
+    """Пул фоновых воркеров генерации в цикле событий процесса.
+
+    Состояние заданий хранится в таблице schedule_jobs, поэтому статус можно
+    спросить у любого воркера uvicorn. Выполнение начинается с захвата строки
+    (queued -> running с увеличением attempts), и все следующие смены статуса
+    проходят, только пока строка running с тем же attempts. succeeded пишется
+    в транзакции, создающей расписание, поэтому задание не создаёт два расписания.
+
+    Свои задания (в очереди и выполняемые) процесс регулярно отмечает в updated_at.
+    Задание queued/running без отметок дольше SCHEDULE_JOB_STALE_SECONDS брошено
+    упавшим процессом, его подбирает любой работающий процесс.
+    """
+
+    def __init__(self, workers: int, max_pending: int, max_attempts: int, retry_delay: float, stale_seconds: float):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.stale_seconds = stale_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # Задания этого процесса: ждут в очереди или выполняются
+        self._owned: Set[str] = set()
+        # Промежуточный прогресс выполняемых здесь заданий: в БД пишутся только смены статуса,
+        # чтобы не конкурировать за запись с самой генерацией
+        self._progress: Dict[str, float] = {}
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.rejected = 0
+        self.recovered = 0
+        self.lost = 0
+
+    def start(self) -> None:
+        # Создаём в запущенном цикле: в Python 3.9 очередь привязывается к текущему циклу
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._maintenance_loop()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        self._owned.clear()
+
+    def _put(self, job_id: str) -> None:
+        self._owned.add(job_id)
+        self._queue.put_nowait(job_id)
+
+    async def enqueue(self, db: AsyncSession, user_id: int, questionnaire_id: int, mode: str) -> models.ScheduleJob:
+        """Сохраняет задание и ставит его в очередь или сразу отвечает 503"""
+        if self._queue is None or self._queue.qsize() >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Сервер перегружен, повторите попытку позже",
+                headers={"Retry-After": "1"},
+            )
+        job = models.ScheduleJob(id=uuid.uuid4().hex, user_id=user_id, questionnaire_id=questionnaire_id, mode=mode)
+        db.add(job)
+        await db.commit()
+        self._put(job.id)
+        return job
+
+    async def _update(self, job_id: str, *conditions, **values) -> bool:
+        """UPDATE строки задания при условиях; True, если строка изменилась"""
+        async with writer_slot():
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    update(models.ScheduleJob)
+                    .where(models.ScheduleJob.id == job_id, *conditions)
+                    .values(**values)
+                )
+                await db.commit()
+        return result.rowcount == 1
+
+    @staticmethod
+    def _running(attempt: int) -> tuple:
+        """Строка всё ещё принадлежит выполнению с этим номером попытки"""
+        return models.ScheduleJob.status == "running", models.ScheduleJob.attempts == attempt
+
+    async def heartbeat(self) -> None:
+        """Отметка своих заданий, чтобы другие процессы не сочли их брошенными"""
+        if not self._owned:
+            return
+        async with writer_slot():
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(models.ScheduleJob)
+                    .where(
+                        models.ScheduleJob.id.in_(list(self._owned)),
+                        models.ScheduleJob.status.in_(("queued", "running")),
+                    )
+                    .values(updated_at=datetime.utcnow())
+                )
+                await db.commit()
+
+    async def recover_stale(self) -> int:
+        """Брошенные задания: исчерпавшие попытки - в failed, остальные - в свою очередь.
+        Условие на updated_at в UPDATE не даёт двум процессам забрать одно задание."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_seconds)
+        stale = [
+            models.ScheduleJob.status.in_(("queued", "running")),
+            models.ScheduleJob.updated_at < cutoff,
+        ]
+        if self._owned:
+            stale.append(models.ScheduleJob.id.notin_(list(self._owned)))
+        async with writer_slot():
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    update(models.ScheduleJob)
+                    .where(*stale, models.ScheduleJob.attempts >= self.max_attempts)
+                    .values(status="failed", error="Задание прервано")
+                )
+                failed = result.rowcount
+                requeued = (await db.scalars(
+                    update(models.ScheduleJob)
+                    .where(*stale)
+                    .values(status="queued", progress=0.0)
+                    .returning(models.ScheduleJob.id)
+                )).all()
+                await db.commit()
+        for job_id in requeued:
+            self._put(job_id)
+        if failed or requeued:
+            self.recovered += failed + len(requeued)
+            logger.warning("Recovered stale schedule jobs", extra={"requeued": len(requeued), "failed": failed})
+        return failed + len(requeued)
+
+    async def _maintenance_loop(self) -> None:
+        while True:
+            try:
+                await self.heartbeat()
+                await self.recover_stale()
+            except Exception:
+                logger.exception("Schedule job maintenance failed")
+            # Несколько отметок за SCHEDULE_JOB_STALE_SECONDS: одна задержка не делает задание брошенным
+            await asyncio.sleep(self.stale_seconds / 3)
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            # Логи задания помечаются его id вместо id HTTP-запроса
+            token = request_id_var.set(f"job-{job_id}")
+            try:
+                await self._run(job_id)
+            except Exception:
+                logger.exception("Schedule job crashed")
+            finally:
+                request_id_var.reset(token)
+                self._owned.discard(job_id)
+                self._queue.task_done()
+
+    async def _run(self, job_id: str) -> None:
+        async with AsyncSessionLocal() as db:
+            job = await db.get(models.ScheduleJob, job_id)
+        if job is None or job.status != "queued":
+            return
+
+        def on_progress(value: float) -> None:
+            self._progress[job_id] = value
+
+        # Задание, подобранное recover_stale, продолжает счёт попыток упавшего процесса
+        attempt = job.attempts
+        try:
+            while attempt < self.max_attempts:
+                claimed = await self._update(
+                    job_id,
+                    models.ScheduleJob.status == "queued",
+                    models.ScheduleJob.attempts == attempt,
+                    status="running", attempts=attempt + 1, progress=0.1, error=None,
+                )
+                if not claimed:
+                    # Задание уже выполняет или выполнил другой процесс
+                    return
+                attempt += 1
+                on_progress(0.1)
+
+                async def finish(db: AsyncSession, schedule: models.TrainingSchedule, attempt: int = attempt) -> None:
+                    result = await db.execute(
+                        update(models.ScheduleJob)
+                        .where(models.ScheduleJob.id == job_id, *self._running(attempt))
+                        .values(status="succeeded", progress=1.0, schedule_id=schedule.id, error=None)
+                    )
+                    if result.rowcount != 1:
+                        raise _JobLost()
+
+                try:
+                    async with writer_slot():
+                        async with AsyncSessionLocal() as db:
+                            await create_schedule(db, job.user_id, job.questionnaire_id, job.mode, on_progress, finish)
+                except _JobLost:
+                    # Расписание откатилось вместе с транзакцией; задание доделает новый владелец
+                    self.lost += 1
+                    logger.warning("Schedule job was taken over by another process")
+                    return
+                except HTTPException as e:
+                    # Ошибка в данных (нет анкеты или упражнений): повтор не поможет
+                    self.failed += 1
+                    await self._update(job_id, *self._running(attempt), status="failed", error=str(e.detail))
+                    return
+                except Exception as e:
+                    logger.warning("Schedule job attempt %d failed: %s", attempt, e)
+                    if attempt >= self.max_attempts:
+                        self.failed += 1
+                        await self._update(job_id, *self._running(attempt), status="failed", error=str(e))
+                        return
+                    self.retried += 1
+                    if not await self._update(job_id, *self._running(attempt), status="queued", error=str(e)):
+                        return
+                    await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+                    continue
+                self.completed += 1
+                return
+            # Попытки исчерпаны ещё до запуска
+            if await self._update(
+                job_id,
+                models.ScheduleJob.status == "queued",
+                models.ScheduleJob.attempts == attempt,
+                status="failed", error="Задание прервано",
+            ):
+                self.failed += 1
+        except asyncio.CancelledError:
+            # Остановка процесса: прерванная попытка не засчитывается, задание подберёт
+            # recover_stale. Если succeeded уже записан или задание ждало повтора, строка не меняется
+            await self._update(
+                job_id, *self._running(attempt),
+                status="queued", attempts=attempt - 1, progress=0.0, error="Прервано остановкой сервера",
+            )
+            raise
+        finally:
+            self._progress.pop(job_id, None)
+
+    def progress(self, job: models.ScheduleJob) -> float:
+        return self._progress.get(job.id, job.progress)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "running": self._queue is not None,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retried": self.retried,
+            "rejected": self.rejected,
+            "recovered": self.recovered,
+            "lost": self.lost,
+            "owned": len(self._owned),
+            "stale_seconds": self.stale_seconds,
+        }
+
+
+schedule_jobs = ScheduleJobRunner(
+    SCHEDULE_JOB_WORKERS,
+    SCHEDULE_JOB_MAX_PENDING,
+    SCHEDULE_JOB_MAX_ATTEMPTS,
+    SCHEDULE_JOB_RETRY_DELAY,
+    SCHEDULE_JOB_STALE_SECONDS,
+)
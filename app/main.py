@@ -1,13 +1,43 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.database import init_db
-from app.routers import auth, exercises, history, questionnaires, schedules
+from app.catalog import exercise_catalog
+from app.database import AsyncSessionLocal, engine, init_db
+from app.generation import schedule_jobs
+from app.logging_config import RequestIdMiddleware, configure_logging, shutdown_logging
+from app.metrics import MetricsMiddleware
+from app.passwords import hasher_pool
+from app.query_profiler import QUERY_PROFILING, QueryProfilerMiddleware
+from app.routers import auth, diagnostics, exercises, history, metrics, progress, questionnaires, schedules
+from app.worker_stats import worker_stats
 
-app = FastAPI(title="Health App API", version="0.0.1")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_logging()
+    await init_db()
+    async with AsyncSessionLocal() as db:
+        # Под app.server каталог уже загружен в родителе до fork
+        await exercise_catalog.get(db)
+    schedule_jobs.start()
+    worker_stats.start()
+    yield
+    await schedule_jobs.stop()
+    await worker_stats.stop()
+    hasher_pool.shutdown()
+    await engine.dispose()
+    shutdown_logging()
 
-init_db()
+app = FastAPI(title="Health App API", version="0.0.1", lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+if QUERY_PROFILING:
+    app.add_middleware(QueryProfilerMiddleware)
+# Последним - самым внешним: id запроса есть и в логах остальных middleware
+app.add_middleware(RequestIdMiddleware)
 
 app.include_router(auth.router)
 app.include_router(questionnaires.router)
 app.include_router(schedules.router)
 app.include_router(history.router)  
-app.include_router(exercises.router)
\ No newline at end of file
+app.include_router(exercises.router)
+app.include_router(progress.router)
+app.include_router(diagnostics.router)
+app.include_router(metrics.router)
\ No newline at end of file
@@ -0,0 +1,276 @@
+import bisect
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+BCRYPT_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0, 5.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _merge_values(metric, dumps: Iterable[list]) -> Dict[Tuple[str, ...], object]:
+    """Сводит ряды одной метрики из снимков нескольких процессов"""
+    merged: Dict[Tuple[str, ...], object] = {}
+    for values in dumps:
+        for labels, value in values:
+            key = tuple(labels)
+            current = merged.get(key)
+            if current is None:
+                merged[key] = [list(value[0]), value[1], value[2]] if metric.kind == "histogram" else value
+            elif metric.kind == "histogram":
+                current[0] = [a + b for a, b in zip(current[0], value[0])]
+                current[1] += value[1]
+                current[2] += value[2]
+            elif getattr(metric, "aggregate", "sum") == "max":
+                merged[key] = max(current, value)
+            else:
+                merged[key] = current + value
+    return merged
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dump(self) -> list:
+        with self._lock:
+            return [[list(labels), value] for labels, value in self._values.items()]
+
+    def render(self, values: Optional[dict] = None) -> List[str]:
+        if values is None:
+            with self._lock:
+                values = dict(self._values)
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> (счётчики по корзинам, сумма, количество)
+        self._values: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: Tuple[str, ...] = ()) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def dump(self) -> list:
+        with self._lock:
+            return [[list(labels), [list(counts), total, count]] for labels, (counts, total, count) in self._values.items()]
+
+    def render(self, values: Optional[dict] = None) -> List[str]:
+        if values is None:
+            with self._lock:
+                values = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._values.items()}
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Gauge:
+    """Значение читается функцией в момент выдачи /metrics.
+    metric_type="counter" - для монотонных счётчиков, которые ведутся в другом месте.
+    aggregate - как сводить значения воркеров: "sum" или "max"."""
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], Optional[float]],
+                 metric_type: str = "gauge", aggregate: str = "sum"):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+        self.kind = self.metric_type = metric_type
+        self.aggregate = aggregate
+
+    def dump(self) -> list:
+        value = self.read()
+        return [] if value is None else [[[], value]]
+
+    def render(self, values: Optional[dict] = None) -> List[str]:
+        if values is None:
+            values = {(): value for _, value in self.dump()}
+        if () not in values:
+            return []
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+            f"{self.name} {_format_value(values[()])}",
+        ]
+
+
+class Registry:
+    """Счётчики живут в памяти процесса. Под app.server воркеров несколько: каждый
+    выгружает dump() в app.worker_stats, а /metrics отдаёт их сумму (merge)."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def dump(self) -> Dict[str, list]:
+        """Ряды всех метрик в виде, пригодном для JSON"""
+        return {metric.name: metric.dump() for metric in self._metrics}
+
+    def merge(self, dumps: Sequence[Dict[str, list]], monotonic: bool = False) -> Dict[str, list]:
+        """Сводит снимки процессов. monotonic - только счётчики и гистограммы:
+        текущие значения (gauge) завершившихся воркеров не имеют смысла"""
+        merged = {}
+        for metric in self._metrics:
+            if monotonic and metric.kind == "gauge":
+                continue
+            values = _merge_values(metric, (dump.get(metric.name, []) for dump in dumps))
+            merged[metric.name] = [[list(labels), value] for labels, value in values.items()]
+        return merged
+
+    def render(self, dump: Optional[Dict[str, list]] = None) -> str:
+        """Счётчики процесса или, если передан, сводный снимок"""
+        lines = []
+        for metric in self._metrics:
+            values = None if dump is None else {tuple(labels): value for labels, value in dump.get(metric.name, [])}
+            lines.extend(metric.render(values))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUESTS = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status")))
+REQUEST_LATENCY = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route")))
+DB_QUERIES = registry.register(Counter(
+    "db_queries_total", "SQL statements executed by route", ("route",)))
+DB_QUERY_SECONDS = registry.register(Counter(
+    "db_query_seconds_total", "Time spent in SQL statements by route", ("route",)))
+DB_QUERIES_PER_REQUEST = registry.register(Histogram(
+    "db_queries_per_request", "SQL statements per HTTP request", ("route",), QUERY_COUNT_BUCKETS))
+DB_SECONDS_PER_REQUEST = registry.register(Histogram(
+    "db_seconds_per_request", "Time spent in SQL per HTTP request", ("route",)))
+BCRYPT_SECONDS = registry.register(Histogram(
+    "bcrypt_seconds", "bcrypt hash/verify time in the worker", ("operation",), BCRYPT_BUCKETS))
+BCRYPT_WAIT_SECONDS = registry.register(Histogram(
+    "bcrypt_queue_wait_seconds", "Time bcrypt jobs waited for a worker", ("operation",), LATENCY_BUCKETS))
+
+
+class RequestDbStats:
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+# Счётчики SQL текущего запроса; вне HTTP-запроса (lifespan, фоновые задания) - None
+request_db_stats: ContextVar[Optional[RequestDbStats]] = ContextVar("request_db_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = request_db_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.seconds += time.perf_counter() - context._metrics_started
+
+
+def instrument_engine(sync_engine) -> None:
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def route_label(scope) -> str:
+    """Шаблон пути маршрута, чтобы /schedules/1 и /schedules/2 попадали в один ряд"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: задержка, статус и SQL-нагрузка каждого HTTP-запроса"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestDbStats()
+        token = request_db_stats.set(stats)
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            request_db_stats.reset(token)
+            route = (route_label(scope),)
+            method = scope["method"]
+            REQUESTS.inc((method, route[0], str(status_code)))
+            REQUEST_LATENCY.observe(elapsed, (method, route[0]))
+            DB_QUERIES.inc(route, stats.queries)
+            DB_QUERY_SECONDS.inc(route, stats.seconds)
+            DB_QUERIES_PER_REQUEST.observe(stats.queries, route)
+            DB_SECONDS_PER_REQUEST.observe(stats.seconds, route)
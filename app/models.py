@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Text, JSON, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Text, JSON, DateTime, Boolean, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 from datetime import datetime
@@ -37,6 +37,11 @@ class Exercise(Base):
     steps = Column(JSON)
     tags = Column(JSON)
     image_url = Column(String(500), nullable=True)
+    # Правила частоты для генерации плана; NULL - значения по умолчанию из app/scheduling.py
+    times_per_day = Column(Integer, nullable=True)
+    days_per_week = Column(Integer, nullable=True)
+    # Фиксированное время "HH:MM"; в плане одна тренировка упражнения в день
+    time_slot = Column(String(5), nullable=True)
 
 class ExerciseHistory(Base):
     __tablename__ = "exercise_history"
@@ -49,6 +54,13 @@ class ExerciseHistory(Base):
     notes = Column(Text, nullable=True)
     sets = Column(Integer, nullable=False, default=1)
     pain_level = Column(Integer, nullable=False, default=0)
+    client_id = Column(String(64), nullable=True)  # ключ идемпотентности офлайн-синхронизации
+
+    __table_args__ = (
+        # Страница истории - один проход по диапазону индекса
+        Index("ix_exercise_history_user_date", "user_id", "date_time"),
+        Index("ux_exercise_history_user_client", "user_id", "client_id", unique=True),
+    )
 
 class TrainingSchedule(Base):
     __tablename__ = "training_schedules"
@@ -60,6 +72,13 @@ class TrainingSchedule(Base):
     specific_injury = Column(String, nullable=False)  # specific_injury из анкеты
     generated_at = Column(DateTime, default=datetime.utcnow) # точное время создания записи в UTC
     is_active = Column(Boolean, default=True)  # Чтобы можно было деактивировать старые расписания
+    # "materialized" - все тренировки в таблице trainings,
+    # "compact" - только правила плана, в trainings лишь выполненные и изменённые
+    mode = Column(String(16), nullable=False, default="materialized", server_default="materialized")
+    start_date = Column(DateTime, nullable=True)  # первый день плана
+    plan_days = Column(Integer, nullable=True)
+    plan_rules = Column(JSON, nullable=True)  # [{"exercise_id", "times_per_day", "days_per_week"}]
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # для дельта-синхронизации
 
     # Связи
     user = relationship("User", back_populates="schedules")
@@ -70,13 +89,77 @@ class Training(Base):
     __tablename__ = "trainings"
 
     id = Column(Integer, primary_key=True, index=True)
-    schedule_id = Column(Integer, ForeignKey("training_schedules.id"), nullable=False)
+    schedule_id = Column(Integer, ForeignKey("training_schedules.id"), nullable=False, index=True)
     exercise_id = Column(Integer, ForeignKey("exercises.id"), nullable=False)
     date = Column(DateTime)  # Дата тренировки (без времени, только день)
     time = Column(String(5))  # Время как строка, напр. "09:00" (перенесено из TimeOfDay)
     is_completed = Column(Boolean, default=False)
     completed_at = Column(DateTime, nullable=True)  # Когда отмечено как выполненное
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # для дельта-синхронизации
 
     # Связи
     schedule = relationship("TrainingSchedule", back_populates="trainings")
-    exercise = relationship("Exercise")
\ No newline at end of file
+    exercise = relationship("Exercise")
+
+    __table_args__ = (
+        # Слот плана - одна строка: отметка compact-слота вставляет её через upsert по этому ключу
+        Index("ux_trainings_slot", "schedule_id", "date", "exercise_id", unique=True),
+    )
+
+class WeeklyProgress(Base):
+    """Недельные агрегаты пользователя; обновляются инкрементально (см. app/progress.py)"""
+    __tablename__ = "weekly_progress"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    week_start = Column(DateTime, nullable=False)  # понедельник 00:00
+    trainings_planned = Column(Integer, nullable=False, default=0)
+    trainings_completed = Column(Integer, nullable=False, default=0)
+    history_entries = Column(Integer, nullable=False, default=0)
+    duration_total = Column(Integer, nullable=False, default=0)  # в секундах
+    pain_level_sum = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ux_weekly_progress_user_week", "user_id", "week_start", unique=True),
+    )
+
+
+class SyncTombstone(Base):
+    """Удалённые строки, о которых клиент узнаёт из /schedules/changes"""
+    __tablename__ = "sync_tombstones"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    entity = Column(String(16), nullable=False)  # "schedule" | "training"
+    entity_id = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_sync_tombstones_user_deleted", "user_id", "deleted_at"),
+    )
+
+
+class ScheduleJob(Base):
+    """Фоновая генерация расписания (POST /schedules/?async=true)"""
+    __tablename__ = "schedule_jobs"
+
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    questionnaire_id = Column(Integer, ForeignKey("questionnaires.id"), nullable=False)
+    mode = Column(String(16), nullable=False, default="materialized")
+    status = Column(String(16), nullable=False, default="queued")  # queued | running | succeeded | failed
+    progress = Column(Float, nullable=False, default=0.0)  # 0..1
+    attempts = Column(Integer, nullable=False, default=0)
+    schedule_id = Column(Integer, ForeignKey("training_schedules.id"), nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class SeedState(Base):
+    """Контрольные суммы применённой схемы и засеянных данных (см. app/seed_state.py)"""
+    __tablename__ = "seed_state"
+
+    name = Column(String(64), primary_key=True)  # "schema" | "exercises"
+    checksum = Column(String(64), nullable=False)
+    applied_at = Column(DateTime, nullable=True)
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import os
+import signal
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+import bcrypt
+from fastapi import HTTPException, status
+
+from app.metrics import BCRYPT_SECONDS, BCRYPT_WAIT_SECONDS
+
+# bcrypt отпускает GIL, поэтому пула потоков обычно достаточно
+BCRYPT_EXECUTOR = os.getenv("BCRYPT_EXECUTOR", "thread")
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Выполняющиеся + ожидающие задачи; сверх этого запросы получают 503
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", "16"))
+
+logger = logging.getLogger(__name__)
+
+
+def _hashpw(password: str):
+    started = time.perf_counter()
+    hashed = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    return hashed, time.perf_counter() - started
+
+
+def _checkpw(plain_password: str, hashed_password: str):
+    started = time.perf_counter()
+    try:
+        result = bcrypt.checkpw(plain_password.encode("utf-8"), hashed_password.encode("utf-8"))
+    except Exception as e:
+        logger.warning("Password verification error: %s", e)
+        result = False
+    return result, time.perf_counter() - started
+
+
+def _init_process_worker() -> None:
+    """Процесс пула наследует обработчики сигналов uvicorn, которые в нём ничего не
+    останавливают. SIGTERM снова завершает процесс, Ctrl+C обрабатывает родитель."""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class PasswordHasherPool:
+    """Отдельный ограниченный пул для bcrypt с контролем допуска"""
+
+    def __init__(self, kind: str, workers: int, max_pending: int):
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_process_worker)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    def _done(self, future: Future) -> None:
+        with self._lock:
+            self.pending -= 1
+            if not future.cancelled() and future.exception() is None:
+                _, elapsed = future.result()
+                self.completed += 1
+                self.total_seconds += elapsed
+                self.max_seconds = max(self.max_seconds, elapsed)
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Ставит задачу в очередь или сразу отвечает 503, если пул переполнен"""
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Сервер перегружен, повторите попытку позже",
+                    headers={"Retry-After": "1"},
+                )
+            self.pending += 1
+            executor = self._get_executor()
+        try:
+            future = executor.submit(fn, *args)
+        except Exception:
+            with self._lock:
+                self.pending -= 1
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "executor": self.kind,
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "queue_depth": max(0, self.pending - self.workers),
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_hash_ms": self.total_seconds / self.completed * 1000 if self.completed else 0.0,
+                "max_hash_ms": self.max_seconds * 1000,
+            }
+
+
+hasher_pool = PasswordHasherPool(BCRYPT_EXECUTOR, BCRYPT_WORKERS, BCRYPT_MAX_PENDING)
+
+
+async def _run_timed(operation: str, fn: Callable, *args):
+    """Задача в пуле bcrypt; время работы и ожидания в очереди уходит в /metrics"""
+    submitted = time.perf_counter()
+    result, elapsed = await asyncio.wrap_future(hasher_pool.submit(fn, *args))
+    BCRYPT_SECONDS.observe(elapsed, (operation,))
+    BCRYPT_WAIT_SECONDS.observe(max(0.0, time.perf_counter() - submitted - elapsed), (operation,))
+    return result, elapsed
+
+
+async def hash_password(password: str) -> str:
+    """Хеширование пароля с помощью bcrypt"""
+    hashed, _ = await _run_timed("hash", _hashpw, password)
+    return hashed
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Проверка пароля с помощью прямой библиотеки bcrypt"""
+    result, _ = await _run_timed("verify", _checkpw, plain_password, hashed_password)
+    return result
@@ -0,0 +1,132 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.database import dialect_insert
+from app.scheduling import iter_plan
+
+COUNTERS = (
+    "trainings_planned",
+    "trainings_completed",
+    "history_entries",
+    "duration_total",
+    "pain_level_sum",
+)
+
+
+def week_start(moment: datetime) -> datetime:
+    """Понедельник 00:00 недели, в которую попадает moment"""
+    day = moment.date() - timedelta(days=moment.weekday())
+    return datetime.combine(day, datetime.min.time())
+
+
+def is_plan_slot(schedule: models.TrainingSchedule, date: datetime, exercise_id: int) -> bool:
+    """Слот compact-расписания уже учтён в trainings_planned при генерации"""
+    if schedule.mode != "compact" or date is None:
+        return False
+    return any(
+        planned_exercise_id == exercise_id
+        for _, planned_exercise_id, _ in iter_plan(schedule.plan_rules, schedule.start_date, schedule.plan_days, date, date)
+    )
+
+
+class ProgressDelta:
+    """Изменения недельных агрегатов в рамках одного запроса"""
+
+    def __init__(self):
+        self._deltas: Dict[Tuple[int, datetime], Dict[str, int]] = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+
+    def add(self, user_id: int, moment: Optional[datetime], **counts: int) -> None:
+        if moment is None:
+            return
+        delta = self._deltas[(user_id, week_start(moment))]
+        for name, value in counts.items():
+            delta[name] += value
+
+    def add_training(self, user_id: int, schedule: models.TrainingSchedule, training, sign: int = 1) -> None:
+        """Вклад строки Training (добавление при sign=1, удаление при sign=-1)"""
+        planned = 0 if is_plan_slot(schedule, training.date, training.exercise_id) else 1
+        self.add(
+            user_id,
+            training.date,
+            trainings_planned=sign * planned,
+            trainings_completed=sign * int(bool(training.is_completed)),
+        )
+
+    def add_history(self, user_id: int, date_time: datetime, duration: int, pain_level: int, sign: int = 1) -> None:
+        self.add(
+            user_id,
+            date_time,
+            history_entries=sign,
+            duration_total=sign * duration,
+            pain_level_sum=sign * pain_level,
+        )
+
+    async def apply(self, db: AsyncSession) -> None:
+        """Один UPSERT с приращением счётчиков; коммит остаётся за вызывающим"""
+        rows = [
+            {"user_id": user_id, "week_start": week, **counts}
+            for (user_id, week), counts in self._deltas.items()
+            if any(counts.values())
+        ]
+        self._deltas.clear()
+        if not rows:
+            return
+        table = models.WeeklyProgress.__table__
+        stmt = dialect_insert(models.WeeklyProgress).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "week_start"],
+            set_={name: table.c[name] + stmt.excluded[name] for name in COUNTERS},
+        )
+        await db.execute(stmt)
+
+
+async def rebuild(db: AsyncSession, user_id: Optional[int] = None) -> None:
+    """Пересчёт агрегатов с нуля (заполнение после миграции); коммит остаётся за вызывающим"""
+    delta = ProgressDelta()
+    schedules = select(models.TrainingSchedule)
+    trainings = (
+        select(models.Training.date, models.Training.exercise_id, models.Training.is_completed,
+               models.Training.schedule_id, models.TrainingSchedule.user_id)
+        .join(models.TrainingSchedule, models.Training.schedule_id == models.TrainingSchedule.id)
+    )
+    history = select(
+        models.ExerciseHistory.user_id,
+        models.ExerciseHistory.date_time,
+        models.ExerciseHistory.duration,
+        models.ExerciseHistory.pain_level,
+    )
+    clear = delete(models.WeeklyProgress)
+    if user_id is not None:
+        schedules = schedules.where(models.TrainingSchedule.user_id == user_id)
+        trainings = trainings.where(models.TrainingSchedule.user_id == user_id)
+        history = history.where(models.ExerciseHistory.user_id == user_id)
+        clear = clear.where(models.WeeklyProgress.user_id == user_id)
+
+    by_id = {schedule.id: schedule for schedule in (await db.execute(schedules)).scalars()}
+    for schedule in by_id.values():
+        if schedule.mode == "compact":
+            for date, _, _ in iter_plan(schedule.plan_rules, schedule.start_date, schedule.plan_days):
+                delta.add(schedule.user_id, date, trainings_planned=1)
+    for row in await db.execute(trainings):
+        delta.add_training(row.user_id, by_id[row.schedule_id], row)
+    for row in await db.execute(history):
+        delta.add_history(row.user_id, row.date_time, row.duration, row.pain_level)
+
+    await db.execute(clear)
+    await delta.apply(db)
+
+
+async def backfill_if_empty(db: AsyncSession) -> None:
+    """Первый запуск с таблицей агрегатов: заполняем её по уже накопленным данным"""
+    if await db.scalar(select(func.count()).select_from(models.WeeklyProgress)):
+        return
+    has_data = await db.scalar(select(func.count()).select_from(models.TrainingSchedule)) or \
+        await db.scalar(select(func.count()).select_from(models.ExerciseHistory))
+    if has_data:
+        await rebuild(db)
+        await db.commit()
@@ -0,0 +1,122 @@
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from sqlalchemy import event
+
+# Только для разработки и тестов: каждый SQL-запрос запоминается целиком
+QUERY_PROFILING = os.getenv("QUERY_PROFILING", "false").lower() in ("1", "true", "yes")
+QUERY_PROFILE_SLOW_MS = float(os.getenv("QUERY_PROFILE_SLOW_MS", "100"))
+# Одинаковый по форме запрос столько раз за HTTP-запрос - вероятный N+1
+QUERY_PROFILE_REPEAT_THRESHOLD = int(os.getenv("QUERY_PROFILE_REPEAT_THRESHOLD", "3"))
+
+logger = logging.getLogger(__name__)
+
+_placeholder_list = re.compile(r"\((?:\s*(?:\?|%s|\$\d+|:\w+)\s*,)+\s*(?:\?|%s|\$\d+|:\w+)\s*\)")
+_numbered_placeholder = re.compile(r"\$\d+")
+_whitespace = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """Текст запроса без различий в числе параметров IN (...) и пробелах"""
+    shape = _numbered_placeholder.sub("?", statement)
+    shape = _placeholder_list.sub("(?...)", shape)
+    return _whitespace.sub(" ", shape).strip()
+
+
+class QueryProfile:
+    """SQL-запросы одного HTTP-запроса"""
+
+    def __init__(self):
+        self.statements: List[Tuple[str, float]] = []
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.statements.append((statement_shape(statement), seconds))
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(seconds for _, seconds in self.statements)
+
+    def repeated(self, threshold: int = QUERY_PROFILE_REPEAT_THRESHOLD) -> List[Tuple[str, int]]:
+        counts = Counter(shape for shape, _ in self.statements)
+        return [(shape, count) for shape, count in counts.most_common() if count >= threshold]
+
+    def slow(self, threshold_ms: float = QUERY_PROFILE_SLOW_MS) -> List[Tuple[str, float]]:
+        return [(shape, seconds) for shape, seconds in self.statements if seconds * 1000 >= threshold_ms]
+
+    def headers(self) -> List[Tuple[bytes, bytes]]:
+        return [
+            (b"x-query-count", str(len(self.statements)).encode()),
+            (b"x-query-time-ms", f"{self.total_seconds * 1000:.1f}".encode()),
+            (b"x-query-repeated", str(len(self.repeated())).encode()),
+            (b"x-query-slow", str(len(self.slow())).encode()),
+        ]
+
+
+current_profile: ContextVar[Optional[QueryProfile]] = ContextVar("current_query_profile", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._profiler_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile.get()
+    if profile is not None:
+        profile.record(statement, time.perf_counter() - context._profiler_started)
+
+
+def instrument_engine(sync_engine) -> None:
+    if not QUERY_PROFILING:
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class QueryProfilerMiddleware:
+    """Сводка по SQL в заголовках X-Query-* и предупреждение в лог при N+1 и медленных запросах.
+
+    Запросы, выполненные после начала ответа (потоковые ответы), попадают только в лог.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = QueryProfile()
+        token = current_profile.set(profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + profile.headers()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_profile.reset(token)
+            self._report(scope, profile)
+
+    @staticmethod
+    def _report(scope, profile: QueryProfile) -> None:
+        repeated = profile.repeated()
+        slow = profile.slow()
+        if not repeated and not slow:
+            return
+        route = getattr(scope.get("route"), "path", scope.get("path"))
+        lines = [
+            f"{scope.get('method')} {route}: {len(profile.statements)} queries, "
+            f"{profile.total_seconds * 1000:.1f} ms"
+        ]
+        lines.extend(f"  repeated x{count}: {shape[:200]}" for shape, count in repeated)
+        lines.extend(f"  slow {seconds * 1000:.1f} ms: {shape[:200]}" for shape, seconds in slow)
+        logger.warning("\n".join(lines))
@@ -1,100 +1,79 @@
-import bcrypt
+import logging
 from fastapi import APIRouter, Depends, HTTPException, status, Body
-from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from sqlalchemy.orm import Session
-from app import models, schemas
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import models, schemas, tokens
+from app.credential_cache import credential_cache
 from app.database import get_db
+from app.dependencies import get_current_user
+from app.passwords import hash_password
 
 router = APIRouter()
-security = HTTPBasic()
-
-def hash_password(password: str) -> str:
-    """Хеширование пароля с помощью bcrypt"""
-    password_bytes = password.encode('utf-8')
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password_bytes, salt)
-    return hashed.decode('utf-8')
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Проверка пароля"""
-    try:
-        plain_bytes = plain_password.encode('utf-8')
-        hashed_bytes = hashed_password.encode('utf-8')
-        return bcrypt.checkpw(plain_bytes, hashed_bytes)
-    except Exception as e:
-        print(f"Ошибка верификации пароля: {e}")
-        return False
-
-def authenticate(credentials: HTTPBasicCredentials, db: Session):
-    user = db.query(models.User).filter(
-        models.User.username == credentials.username
-    ).first()
-
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid credentials",
-            headers={"WWW-Authenticate": "Basic"},
-        )
-    
-    # Используем прямую проверку bcrypt
-    if not verify_password(credentials.password, user.password):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid credentials",
-            headers={"WWW-Authenticate": "Basic"},
-        )
-    return user
-
-def get_current_user(credentials: HTTPBasicCredentials = Depends(security), db: Session = Depends(get_db)):
-    return authenticate(credentials, db)
+logger = logging.getLogger(__name__)
 
 @router.post("/register", response_model=schemas.UserOut)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(models.User).filter(
+async def register(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(models.User).where(
         models.User.username == user.username
-    ).first()
+    ))
+    existing_user = result.scalars().first()
 
     if existing_user:
         raise HTTPException(status_code=400, detail="Логин уже зарегистрирован")
 
     # Используем прямое хеширование bcrypt
-    hashed_password = hash_password(user.password)
+    hashed_password = await hash_password(user.password)
     db_user = models.User(username=user.username, password=hashed_password)
 
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
 
     return {
         "id": db_user.id,
         "username": db_user.username
     }
 
-@router.get("/login")
-def login(user: models.User = Depends(get_current_user)):
+@router.get("/login", response_model=schemas.LoginOut)
+async def login(user: models.User = Depends(get_current_user)):
     return {
         "id": user.id,
-        "username": user.username
+        "username": user.username,
+        **tokens.issue_token_pair(user.id, user.username, user.password)
     }
 
+@router.post("/token/refresh", response_model=schemas.TokenPair)
+async def refresh_token(data: schemas.TokenRefresh, db: AsyncSession = Depends(get_db)):
+    try:
+        claims = tokens.decode_token(data.refresh_token, tokens.REFRESH)
+    except tokens.TokenError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+
+    user = await db.get(models.User, claims["sub"])
+    # После смены пароля отпечаток хеша не совпадёт
+    if not user or claims.get("pwf") != tokens.password_fingerprint(user.password):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+
+    return tokens.issue_token_pair(user.id, user.username, user.password)
+
 @router.post("/reset-password")
-def reset_password(
+async def reset_password(
     username: str = Body(..., embed=True),
     new_password: str = Body(..., embed=True),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    user = db.query(models.User).filter(
+    result = await db.execute(select(models.User).where(
         models.User.username == username
-    ).first()
+    ))
+    user = result.scalars().first()
 
     if not user:
-        print("Если пользователь существует, пароль был изменен")
         return {"message": "Если пользователь существует, пароль был изменен"}
     
     # Используем прямое хеширование bcrypt
-    hashed_password = hash_password(new_password)
+    hashed_password = await hash_password(new_password)
     user.password = hashed_password
-    db.commit()
-    print("Пароль успешно изменен")
+    await db.commit()
+    credential_cache.invalidate_user(username)
+    logger.info("Пароль изменён", extra={"user_id": user.id})
     return {"message": "Пароль успешно изменен"}
\ No newline at end of file
@@ -0,0 +1,59 @@
+import os
+from fastapi import APIRouter
+from app.catalog import exercise_catalog
+from app.credential_cache import credential_cache
+from app.database import pool_stats
+from app.generation import schedule_jobs
+from app.logging_config import logging_stats
+from app.passwords import hasher_pool
+from app.scheduling import plan_templates
+from app.worker_stats import worker_stats
+
+router = APIRouter(prefix="/diagnostics", tags=["Diagnostics"])
+
+SECTIONS = {
+    "auth-cache": credential_cache.stats,
+    "bcrypt": hasher_pool.stats,
+    "db-pool": pool_stats,
+    "catalog": exercise_catalog.stats,
+    "schedule-jobs": schedule_jobs.stats,
+    "plan-templates": plan_templates.stats,
+    "logging": logging_stats,
+}
+for name, read in SECTIONS.items():
+    worker_stats.section(name, read)
+
+def _worker(section: str) -> dict:
+    """Счётчики процесса, принявшего запрос; под app.server в workers - все живые воркеры"""
+    stats = {"pid": os.getpid(), **SECTIONS[section]()}
+    if worker_stats.enabled:
+        stats["workers"] = worker_stats.workers(section)
+    return stats
+
+@router.get("/auth-cache")
+def auth_cache_stats():
+    return _worker("auth-cache")
+
+@router.get("/bcrypt")
+def bcrypt_stats():
+    return _worker("bcrypt")
+
+@router.get("/db-pool")
+def db_pool_stats():
+    return _worker("db-pool")
+
+@router.get("/catalog")
+def catalog_stats():
+    return _worker("catalog")
+
+@router.get("/schedule-jobs")
+def schedule_jobs_stats():
+    return _worker("schedule-jobs")
+
+@router.get("/plan-templates")
+def plan_templates_stats():
+    return _worker("plan-templates")
+
+@router.get("/logging")
+def logging_diagnostics():
+    return _worker("logging")
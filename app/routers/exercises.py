@@ -1,62 +1,101 @@
+import logging
+import os
+from email.utils import formatdate, parsedate_to_datetime
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.dependencies import get_current_user
 from app import models, schemas
+from app.catalog import exercise_catalog
 from app.database import get_db
+from app.logging_config import SAMPLED
 
 router = APIRouter(prefix="/exercises", tags=["Exercises"])
+logger = logging.getLogger(__name__)
+
+# Каталог меняется только при пересеве, его можно кэшировать в CDN/прокси
+EXERCISES_CACHE_MAX_AGE = int(os.getenv("EXERCISES_CACHE_MAX_AGE", "300"))
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # Для If-None-Match используется слабое сравнение (RFC 9110, 13.1.2)
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in candidates)
+
+def _not_modified_since(if_modified_since: str, last_modified: int) -> bool:
+    try:
+        return parsedate_to_datetime(if_modified_since).timestamp() >= last_modified
+    except (TypeError, ValueError):
+        return False
+
+def _catalog_response(request: Request, body: bytes, etag: str, last_modified: int) -> Response:
+    """Готовый JSON из каталога или 304, если у клиента актуальная копия"""
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(last_modified, usegmt=True),
+        "Cache-Control": f"public, max-age={EXERCISES_CACHE_MAX_AGE}",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        not_modified = _etag_matches(if_none_match, etag)
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        not_modified = if_modified_since is not None and _not_modified_since(if_modified_since, last_modified)
+    if not_modified:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @router.get("/debug-exercises", response_model=List[schemas.ExerciseOut])
-def debug_exercises(db: Session = Depends(get_db)):
+async def debug_exercises(db: AsyncSession = Depends(get_db)):
     try:
-        exercises = db.query(models.Exercise).all()
+        exercises = (await db.execute(select(models.Exercise))).scalars().all()
 
-        print(f"Len : {len(exercises)}")
-        for ex in exercises:
-            print(f"ID: {ex.id}, Title: {ex.title}")
-            print(f"Suitable for: {ex.suitable_for}")
-            print(f"Max pain: {ex.max_pain_level}")
+        logger.debug("debug_exercises: %d exercises", len(exercises))
+        if logger.isEnabledFor(logging.DEBUG):
+            for ex in exercises:
+                logger.debug(
+                    "Exercise %s: %s", ex.id, ex.title,
+                    extra={"suitable_for": ex.suitable_for, "max_pain_level": ex.max_pain_level, **SAMPLED},
+                )
 
         return exercises
     except Exception as e:
-        print(f"  debug_exercises: {str(e)}")
+        logger.exception("debug_exercises failed")
         raise HTTPException(status_code=500, detail=str(e))
         
 @router.get("/", response_model=list[schemas.ExerciseOut])
-def get_exercises(
+async def get_exercises(
+    request: Request,
     injury_type: Optional[str] = Query(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    # Получаем ВСЕ упражнения из базы
-    all_exercises = db.query(models.Exercise).all()
+    # Каталог в памяти; БД читается только при первой загрузке и после инвалидации
+    catalog = await exercise_catalog.get(db)
 
-    # Если указан тип травмы - фильтруем
+    # Если указан тип травмы - берём из индекса (регистр не важен)
     if injury_type:
-        # Приводим к нижнему регистру для регистронезависимого сравнения
-        injury_lower = injury_type.lower()
-
-        # Фильтруем упражнения
-        filtered_exercises = [
-            ex for ex in all_exercises
-            if ex.suitable_for and any(
-                injury_lower == s.lower() for s in ex.suitable_for
-            )
-        ]
+        filtered_exercises = catalog.for_injury_type(injury_type)
 
-        # Отладочный вывод
-        print(f"Найдено упражнений после фильтрации: {len(filtered_exercises)}")
-        for ex in filtered_exercises:
-            print(f"Упражнение {ex.id} подходит для '{injury_type}'")
+        logger.debug("Найдено упражнений после фильтрации: %d", len(filtered_exercises), extra={"injury_type": injury_type})
+        if logger.isEnabledFor(logging.DEBUG):
+            # По строке на упражнение - только выборочно
+            for ex in filtered_exercises:
+                logger.debug("Упражнение %s подходит для '%s'", ex.id, injury_type, extra=SAMPLED)
 
-        return filtered_exercises
+        body, etag = catalog.injury_representation(injury_type)
+        return _catalog_response(request, body, etag, catalog.last_modified)
 
     # Если тип травмы не указан - возвращаем все упражнения
-    return all_exercises
+    body, etag = catalog.list_representation()
+    return _catalog_response(request, body, etag, catalog.last_modified)
 
 @router.get("/{exercise_id}", response_model=schemas.ExerciseOut)
-def get_exercise(exercise_id: int, db: Session = Depends(get_db)):
-    exercise = db.query(models.Exercise).get(exercise_id)
-    if not exercise:
+async def get_exercise(exercise_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    catalog = await exercise_catalog.get(db)
+    representation = catalog.item_representation(exercise_id)
+    if not representation:
         raise HTTPException(status_code=404, detail="Exercise not found")
-    return exercise
\ No newline at end of file
+    body, etag = representation
+    return _catalog_response(request, body, etag, catalog.last_modified)
\ No newline at end of file
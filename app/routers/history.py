@@ -1,17 +1,38 @@
-from typing import List
-from fastapi import APIRouter, Depends, Body, HTTPException, Query
-from sqlalchemy.orm import Session
-from app.dependencies import get_current_user
+import base64
+import binascii
+import uuid
+from datetime import datetime
+from typing import List, Optional, Tuple
+from fastapi import APIRouter, Depends, Body, HTTPException, Query, Request, Response
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.dependencies import AuthenticatedUser, get_authenticated_user
 from app import models, schemas
-from app.database import get_db
+from app.database import dialect_insert, get_db, get_write_db
+from app.progress import ProgressDelta
 
 router = APIRouter(prefix="/history", tags=["History"])
 
+HISTORY_PAGE_SIZE = 50
+HISTORY_PAGE_MAX = 200
+
+def encode_cursor(date_time: datetime, history_id: int) -> str:
+    raw = f"{date_time.isoformat()}|{history_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        date_time, history_id = raw.split("|")
+        return datetime.fromisoformat(date_time), int(history_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+
 @router.post("/", response_model=schemas.ExerciseHistoryOut)
-def add_exercise_history(
+async def add_exercise_history(
     history: schemas.ExerciseHistoryCreate,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: AuthenticatedUser = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_write_db)
 ):
     # Проверяем, что пользователь добавляет свою историю
     if current_user.id != history.user_id:
@@ -19,37 +40,135 @@ def add_exercise_history(
 
     db_history = models.ExerciseHistory(**history.dict())
     db.add(db_history)
-    db.commit()
-    db.refresh(db_history)
+    delta = ProgressDelta()
+    delta.add_history(history.user_id, history.date_time, history.duration, history.pain_level)
+    await delta.apply(db)
+    await db.commit()
+    await db.refresh(db_history)
     return db_history
 
+@router.post("/batch", response_model=List[schemas.ExerciseHistoryBatchResult])
+async def add_exercise_history_batch(
+    batch: schemas.ExerciseHistoryBatchCreate,
+    current_user: AuthenticatedUser = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_write_db)
+):
+    """Выгрузка офлайн-записей одним запросом.
+
+    Записи с уже известным client_id не дублируются и возвращаются со статусом duplicate,
+    поэтому клиент может безопасно повторить отправку пакета.
+    """
+    if current_user.id != batch.user_id:
+        raise HTTPException(status_code=403, detail="Запрещено")
+
+    history = models.ExerciseHistory
+    # Без client_id ключ выдаёт сервер, чтобы сопоставить строки с RETURNING
+    rows = {}
+    order = []
+    for item in batch.items:
+        client_id = item.client_id or uuid.uuid4().hex
+        order.append(client_id)
+        if client_id not in rows:
+            rows[client_id] = {**item.dict(exclude={"client_id"}), "user_id": batch.user_id, "client_id": client_id}
+
+    existing = dict((await db.execute(
+        select(history.client_id, history.id)
+        .where(history.user_id == batch.user_id, history.client_id.in_(list(rows)))
+    )).all())
+    created = {}
+    new_rows = [row for client_id, row in rows.items() if client_id not in existing]
+    if new_rows:
+        # Один INSERT на весь пакет; конфликт - параллельная отправка того же пакета
+        result = await db.execute(
+            dialect_insert(history)
+            .values(new_rows)
+            .on_conflict_do_nothing(index_elements=["user_id", "client_id"])
+            .returning(history.client_id, history.id)
+        )
+        created = dict(result.all())
+        missed = [row["client_id"] for row in new_rows if row["client_id"] not in created]
+        if missed:
+            existing.update((await db.execute(
+                select(history.client_id, history.id)
+                .where(history.user_id == batch.user_id, history.client_id.in_(missed))
+            )).all())
+        delta = ProgressDelta()
+        for row in new_rows:
+            if row["client_id"] in created:
+                delta.add_history(batch.user_id, row["date_time"], row["duration"], row["pain_level"])
+        await delta.apply(db)
+    await db.commit()
+
+    results = []
+    reported = set()
+    for client_id in order:
+        if client_id in created and client_id not in reported:
+            results.append({"id": created[client_id], "client_id": client_id, "status": "created"})
+        else:
+            history_id = created[client_id] if client_id in created else existing[client_id]
+            results.append({"id": history_id, "client_id": client_id, "status": "duplicate"})
+        reported.add(client_id)
+    return results
+
 @router.get("/users/{user_id}/history", response_model=List[schemas.ExerciseHistoryOut])
-def get_exercise_history(
+async def get_exercise_history(
     user_id: int,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_PAGE_MAX),
+    cursor: Optional[str] = Query(None, description="Значение X-Next-Cursor предыдущей страницы"),
+    date_from: Optional[datetime] = Query(None),
+    date_to: Optional[datetime] = Query(None),
+    exercise_name: Optional[str] = Query(None),
+    current_user: AuthenticatedUser = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_db)
 ):
     # Проверяем права доступа
     if current_user.id != user_id:
         raise HTTPException(status_code=403, detail="Запрещено")
 
-    return db.query(models.ExerciseHistory).filter(
-        models.ExerciseHistory.user_id == user_id
-    ).order_by(models.ExerciseHistory.date_time.desc()).all()
+    history = models.ExerciseHistory
+    query = select(history).where(history.user_id == user_id)
+    if date_from is not None:
+        query = query.where(history.date_time >= date_from)
+    if date_to is not None:
+        query = query.where(history.date_time <= date_to)
+    if exercise_name is not None:
+        query = query.where(history.exercise_name == exercise_name)
+    if cursor is not None:
+        # Keyset: строго после последней записи предыдущей страницы по (date_time, id)
+        cursor_date_time, cursor_id = decode_cursor(cursor)
+        query = query.where(or_(
+            history.date_time < cursor_date_time,
+            and_(history.date_time == cursor_date_time, history.id < cursor_id),
+        ))
+    query = query.order_by(history.date_time.desc(), history.id.desc()).limit(limit + 1)
+
+    items = (await db.execute(query)).scalars().all()
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1].date_time, items[-1].id)
+        response.headers["X-Next-Cursor"] = next_cursor
+        next_url = request.url.include_query_params(cursor=next_cursor)
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return items
 
 @router.delete("/{history_id}")
-def delete_exercise_history(
+async def delete_exercise_history(
     history_id: int,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: AuthenticatedUser = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_write_db)
 ):
-    history_item = db.query(models.ExerciseHistory).get(history_id)
+    history_item = await db.get(models.ExerciseHistory, history_id)
     if not history_item:
         raise HTTPException(status_code=404, detail="Элемент история не найден")
 
     if history_item.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Запрещено")
 
-    db.delete(history_item)
-    db.commit()
+    delta = ProgressDelta()
+    delta.add_history(history_item.user_id, history_item.date_time, history_item.duration, history_item.pain_level, sign=-1)
+    await db.delete(history_item)
+    await delta.apply(db)
+    await db.commit()
     return {"message": "Элемент истории удалён"}
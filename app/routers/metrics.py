@@ -0,0 +1,28 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.catalog import exercise_catalog
+from app.credential_cache import credential_cache
+from app.database import pool_stats
+from app.generation import schedule_jobs
+from app.metrics import Gauge, registry
+from app.passwords import hasher_pool
+from app.worker_stats import worker_stats
+
+router = APIRouter(tags=["Metrics"])
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Состояние пулов и кэшей - из тех же счётчиков, что и /diagnostics.
+# Под app.server значения воркеров суммируются, версия каталога - максимум
+registry.register(Gauge("db_pool_checked_out", "Connections currently checked out", lambda: pool_stats().get("checked_out")))
+registry.register(Gauge("db_pool_timeouts_total", "Pool checkout timeouts", lambda: pool_stats().get("timeouts"), "counter"))
+registry.register(Gauge("bcrypt_pending", "bcrypt jobs running or queued", lambda: hasher_pool.stats()["pending"]))
+registry.register(Gauge("bcrypt_rejected_total", "bcrypt jobs rejected with 503", lambda: hasher_pool.stats()["rejected"], "counter"))
+registry.register(Gauge("auth_cache_hits_total", "Verified credential cache hits", lambda: credential_cache.stats()["hits"], "counter"))
+registry.register(Gauge("auth_cache_misses_total", "Verified credential cache misses", lambda: credential_cache.stats()["misses"], "counter"))
+registry.register(Gauge("catalog_version", "Exercise catalog snapshot version", lambda: exercise_catalog.stats()["version"], aggregate="max"))
+registry.register(Gauge("schedule_jobs_queued", "Schedule generation jobs waiting", lambda: schedule_jobs.stats()["queued"]))
+
+@router.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return PlainTextResponse(worker_stats.render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,78 @@
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.dependencies import AuthenticatedUser, get_authenticated_user
+from app import models, schemas
+from app.database import get_db
+from app.progress import week_start
+
+router = APIRouter(prefix="/progress", tags=["Progress"])
+
+def _ratio(part: int, total: int) -> Optional[float]:
+    return part / total if total else None
+
+def _weekly_out(row: models.WeeklyProgress) -> dict:
+    return {
+        "week_start": row.week_start,
+        "trainings_planned": row.trainings_planned,
+        "trainings_completed": row.trainings_completed,
+        "adherence": _ratio(row.trainings_completed, row.trainings_planned),
+        "history_entries": row.history_entries,
+        "total_minutes": row.duration_total / 60,
+        "avg_pain_level": _ratio(row.pain_level_sum, row.history_entries),
+    }
+
+async def _load_weeks(
+    db: AsyncSession,
+    user_id: int,
+    date_from: Optional[datetime],
+    date_to: Optional[datetime],
+) -> List[models.WeeklyProgress]:
+    query = select(models.WeeklyProgress).where(models.WeeklyProgress.user_id == user_id)
+    if date_from is not None:
+        query = query.where(models.WeeklyProgress.week_start >= week_start(date_from))
+    if date_to is not None:
+        query = query.where(models.WeeklyProgress.week_start <= date_to)
+    result = await db.execute(query.order_by(models.WeeklyProgress.week_start))
+    return list(result.scalars().all())
+
+@router.get("/users/{user_id}/weekly", response_model=List[schemas.WeeklyProgressOut])
+async def get_weekly_progress(
+    user_id: int,
+    date_from: Optional[datetime] = Query(None),
+    date_to: Optional[datetime] = Query(None),
+    current_user: AuthenticatedUser = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Недельная статистика из готовых агрегатов: одна строка на неделю"""
+    if current_user.id != user_id:
+        raise HTTPException(status_code=403, detail="Запрещено")
+    return [_weekly_out(row) for row in await _load_weeks(db, user_id, date_from, date_to)]
+
+@router.get("/users/{user_id}/summary", response_model=schemas.ProgressSummaryOut)
+async def get_progress_summary(
+    user_id: int,
+    date_from: Optional[datetime] = Query(None),
+    date_to: Optional[datetime] = Query(None),
+    current_user: AuthenticatedUser = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_db)
+):
+    if current_user.id != user_id:
+        raise HTTPException(status_code=403, detail="Запрещено")
+    weeks = await _load_weeks(db, user_id, date_from, date_to)
+    planned = sum(row.trainings_planned for row in weeks)
+    completed = sum(row.trainings_completed for row in weeks)
+    entries = sum(row.history_entries for row in weeks)
+    pain_weeks = [row.pain_level_sum / row.history_entries for row in weeks if row.history_entries]
+    return {
+        "weeks": len(weeks),
+        "trainings_planned": planned,
+        "trainings_completed": completed,
+        "adherence": _ratio(completed, planned),
+        "history_entries": entries,
+        "total_minutes": sum(row.duration_total for row in weeks) / 60,
+        "avg_pain_level": _ratio(sum(row.pain_level_sum for row in weeks), entries),
+        "pain_level_change": pain_weeks[-1] - pain_weeks[0] if len(pain_weeks) > 1 else None,
+    }
@@ -1,33 +1,35 @@
+import logging
 from fastapi import APIRouter, Depends,  HTTPException
-from sqlalchemy.orm import Session
-from app.dependencies import get_current_user
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.dependencies import AuthenticatedUser, get_authenticated_user
 from app import models, schemas
-from app.database import get_db
+from app.database import get_db, get_write_db
 
 router = APIRouter(prefix="/questionnaires", tags=["Questionnaires"])
+logger = logging.getLogger(__name__)
 
 @router.post("/", response_model=schemas.QuestionnaireOut)
-def create_questionnaire(
+async def create_questionnaire(
     questionnaire: schemas.QuestionnaireCreate,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: AuthenticatedUser = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_write_db)
 ):
     try:
-        print(f"User ID: {current_user.id}")
-        print(f"User exists: {db.query(models.User).get(current_user.id) is not None}")
-        print(f"Saving the questionnaire for the user ID: {current_user.id}")
-        print(f"Questionnaire data : {questionnaire.dict()}")
-        
+        # Ответы анкеты - медицинские данные, в лог попадают только идентификаторы
+        logger.debug("Saving the questionnaire", extra={"user_id": current_user.id})
+
         # проверка существования анкеты
-        existing = db.query(models.Questionnaire).filter(
+        result = await db.execute(select(models.Questionnaire).where(
             models.Questionnaire.user_id == current_user.id
-        ).first()
+        ))
+        existing = result.scalars().first()
 
         if existing:
             for key, value in questionnaire.dict().items():
                 setattr(existing, key, value)
-            db.commit()
-            db.refresh(existing)
+            await db.commit()
+            await db.refresh(existing)
             return existing
         else:
             db_questionnaire = models.Questionnaire(
@@ -35,27 +37,29 @@ def create_questionnaire(
                 **questionnaire.dict()
             )
             db.add(db_questionnaire)
-            db.commit()
-            db.refresh(db_questionnaire)
+            await db.commit()
+            await db.refresh(db_questionnaire)
             return db_questionnaire
     except Exception as e:
-        db.rollback()
+        logger.exception("Questionnaire save failed", extra={"user_id": current_user.id})
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     
 
 @router.get("/users/{user_id}/questionnaire", response_model=schemas.QuestionnaireOut)
-def get_questionnaire(
+async def get_questionnaire(
     user_id: int,
-    user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: AuthenticatedUser = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_db)
 ):
 
     if user.id != user_id:
         raise HTTPException(status_code=403, detail="Доступ запрещён")
 
-    questionnaire = db.query(models.Questionnaire).filter(
+    result = await db.execute(select(models.Questionnaire).where(
         models.Questionnaire.user_id == user_id
-    ).first()
+    ))
+    questionnaire = result.scalars().first()
 
     if not questionnaire:
         raise HTTPException(status_code=404, detail="Анкета не найдена")
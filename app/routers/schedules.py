@@ -1,195 +1,439 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
-from sqlalchemy.orm import Session
-from typing import Dict, List
-from app.dependencies import get_current_user
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import AsyncIterator, List, Optional
+from app.dependencies import AuthenticatedUser, get_authenticated_user
 from app import models, schemas
-from app.database import get_db
-from datetime import datetime, timedelta
+from app.database import AsyncSessionLocal, dialect_insert, get_db, get_write_db
+from app.generation import create_schedule, schedule_jobs
+from app.progress import ProgressDelta
+from app.sync import add_tombstone, changes_since, encode_sync_token
+from app.scheduling import iter_plan
+from datetime import date, datetime
 
 
 router = APIRouter(prefix="/schedules", tags=["Schedules"])
 
-def get_exercise_frequency(title: str) -> Dict[str, int]:
-
-    frequencies = {
-        "Изометрическое напряжение мышц": {'times_per_day': 3, 'days_per_week': 7},
-        "Нейропластическая гимнастика": {'times_per_day': 2, 'days_per_week': 5},
-        "Пассивная разработка сустава": {'times_per_day': 2, 'days_per_week': 6},
-        "Дыхательная гимнастика": {'times_per_day': 5, 'days_per_week': 7},
-        "Тренировка мелкой моторики": {'times_per_day': 2, 'days_per_week': 7},
-        "Растяжка ахиллова сухожилия": {'times_per_day': 1, 'days_per_week': 3},
-        "Стабилизация плечевого сустава": {'times_per_day': 2, 'days_per_week': 4},
-        "Восстановление мышц живота": {'times_per_day': 3, 'days_per_week': 5},
-        "Дыхание с сопротивлением": {'times_per_day': 4, 'days_per_week': 7},
-        "Аквааэробика": {'times_per_day': 1, 'days_per_week': 3},
-        "Баланс-терапия": {'times_per_day': 2, 'days_per_week': 5},
-    }
-    return frequencies.get(title, {'times_per_day': 1, 'days_per_week': 3})
-
-def should_add_training(date: datetime, frequency: Dict[str, int]) -> bool:
-    """Перенос логики _shouldAddTraining"""
-    day_of_week = date.weekday()  # 1=Пн, 7=Вс
-    times_per_day = frequency['times_per_day']
-    days_per_week = frequency['days_per_week']
-    is_training_day = day_of_week <= days_per_week
-    return is_training_day and (date.day % (7 // times_per_day if times_per_day > 0 else 1) == 0)
-
-@router.post("/", response_model=schemas.TrainingScheduleOut)
-def generate_schedule(
+# Только колонки из схем ответа: строки вместо ORM-объектов
+SCHEDULE_COLUMNS = (
+    models.TrainingSchedule.id,
+    models.TrainingSchedule.user_id,
+    models.TrainingSchedule.questionnaire_id,
+    models.TrainingSchedule.injury_type,
+    models.TrainingSchedule.specific_injury,
+    models.TrainingSchedule.generated_at,
+    models.TrainingSchedule.is_active,
+    models.TrainingSchedule.mode,
+    models.TrainingSchedule.start_date,
+    models.TrainingSchedule.plan_days,
+    models.TrainingSchedule.updated_at,
+)
+TRAINING_COLUMNS = (
+    models.Training.id,
+    models.Training.schedule_id,
+    models.Training.exercise_id,
+    models.Training.date,
+    models.Training.time,
+    models.Training.is_completed,
+    models.Training.completed_at,
+    models.Training.updated_at,
+)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+STREAM_BATCH_SIZE = 500
+
+def wants_ndjson(request: Request, stream: bool) -> bool:
+    return stream or NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+async def stream_trainings_ndjson(schedule_id: int) -> AsyncIterator[bytes]:
+    """Тренировки построчно в NDJSON, пачками по мере чтения курсора"""
+    # Своя сессия: генератор работает после выхода из эндпоинта
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(
+            select(*TRAINING_COLUMNS)
+            .where(models.Training.schedule_id == schedule_id)
+            .order_by(models.Training.id)
+            .execution_options(yield_per=STREAM_BATCH_SIZE)
+        )
+        async for rows in result.partitions():
+            yield b"".join(
+                schemas.TrainingOut.model_validate(row).model_dump_json().encode("utf-8") + b"\n"
+                for row in rows
+            )
+
+@router.post("/", response_model=schemas.TrainingScheduleOut, responses={202: {"model": schemas.ScheduleJobOut}})
+async def generate_schedule(
     create_data: schemas.TrainingScheduleCreate,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    run_async: bool = Query(False, alias="async", description="Поставить генерацию в очередь и сразу ответить 202"),
+    current_user: AuthenticatedUser = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_write_db)
 ):
-    # Проверяем анкету
-    questionnaire = db.query(models.Questionnaire).filter(
+    if not run_async:
+        return await create_schedule(db, current_user.id, create_data.questionnaire_id, create_data.mode)
+
+    # Проверяем анкету сразу, чтобы не ставить в очередь заведомо неудачное задание
+    result = await db.execute(select(models.Questionnaire.id).where(
         models.Questionnaire.id == create_data.questionnaire_id,
         models.Questionnaire.user_id == current_user.id
-    ).first()
-    print(f"Ищем анкету ID={create_data.questionnaire_id} для user_id={current_user.id}")
-    if not questionnaire:
+    ))
+    if result.first() is None:
         raise HTTPException(status_code=404, detail="Анкета не найдена")
-
-    print(f"DEBUG: Injury type: '{questionnaire.main_injury_type}', specific: '{questionnaire.specific_injury}'")
-    # Получаем ВСЕ упражнения из базы
-    all_exercises = db.query(models.Exercise).all()
-
-    specific_injury = questionnaire.specific_injury
-    # Загружаем упражнения по specific_injury
-    exercises = [
-        exercise for exercise in all_exercises
-        if any(specific_injury in str(item) for item in exercise.suitable_for or [])
-    ]
-
-    print(f"DEBUG: Подходящих упражнений: {len(exercises)}, titles={[e.title for e in exercises]}")
-    if not exercises:
-        raise HTTPException(status_code=404, detail="Нет подходящих упражнений")
-
-    # Создаем расписание
-    schedule = models.TrainingSchedule(
-        user_id=current_user.id,
-        questionnaire_id=questionnaire.id,
-        injury_type=questionnaire.main_injury_type,
-        specific_injury=questionnaire.specific_injury
+    job = await schedule_jobs.enqueue(db, current_user.id, create_data.questionnaire_id, create_data.mode)
+    return JSONResponse(
+        status_code=202,
+        content=jsonable_encoder(_job_out(job)),
+        headers={"Location": f"{router.prefix}/jobs/{job.id}"},
     )
-    db.add(schedule)
-    db.commit()
-    db.refresh(schedule)
-
-    # Генерируем тренировки на 84 дня
-    current_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    end_date = current_date + timedelta(days=84)
-
-    while current_date < end_date:
-        for exercise in exercises:
-            frequency = get_exercise_frequency(exercise.title)
-            if should_add_training(current_date, frequency):
-                # Время: простая логика (9:00 + offset)
-                time_offset = len([e for e in exercises if should_add_training(current_date, get_exercise_frequency(e.title))]) * 30  # 30 мин интервал
-                training_time = f"{9 + (time_offset // 60):02d}:{(time_offset % 60):02d}"
-
-                training = models.Training(
-                    schedule_id=schedule.id,
-                    exercise_id=exercise.id,
-                    date=current_date,
-                    time=training_time,
-                    is_completed=False
-                )
-                db.add(training)
-        current_date += timedelta(days=1)
-
-    db.commit()
-    # Перезагружаем для возврата с тренировками
-    db.refresh(schedule)
-    return schedule
+
+def _job_out(job: models.ScheduleJob) -> dict:
+    return {
+        "id": job.id,
+        "status": job.status,
+        "progress": schedule_jobs.progress(job),
+        "attempts": job.attempts,
+        "schedule_id": job.schedule_id,
+        "error": job.error,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
+
+@router.get("/jobs/{job_id}", response_model=schemas.ScheduleJobOut)
+async def get_schedule_job(
+    job_id: str,
+    current_user: AuthenticatedUser = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Статус фоновой генерации; после succeeded расписание доступно по schedule_id"""
+    job = await db.get(models.ScheduleJob, job_id)
+    if not job or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+    return _job_out(job)
 
 @router.get("/users/{user_id}/schedules", response_model=List[schemas.TrainingScheduleOut])
-def get_schedules(
+async def get_schedules(
     user_id: int,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: AuthenticatedUser = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_db)
 ):
     if current_user.id != user_id:
         raise HTTPException(status_code=403, detail="Доступ запрещён")
-    schedules = db.query(models.TrainingSchedule).filter(
+    # Два запроса на любое число расписаний: сами расписания и все их тренировки
+    result = await db.execute(select(*SCHEDULE_COLUMNS).where(
         models.TrainingSchedule.user_id == user_id,
         models.TrainingSchedule.is_active == True
-    ).all()
-    for schedule in schedules:
-        schedule.trainings = db.query(models.Training).filter(
-            models.Training.schedule_id == schedule.id
-        ).all()
-    return schedules
+    ).order_by(models.TrainingSchedule.id))
+    schedules = {row["id"]: {**row, "trainings": []} for row in result.mappings()}
+    if schedules:
+        result = await db.execute(select(*TRAINING_COLUMNS).where(
+            models.Training.schedule_id.in_(list(schedules))
+        ).order_by(models.Training.schedule_id, models.Training.id))
+        for row in result.mappings():
+            schedules[row["schedule_id"]]["trainings"].append(row)
+    return list(schedules.values())
+
+@router.get("/changes", response_model=schemas.SyncChangesOut)
+async def get_schedule_changes(
+    since: Optional[str] = Query(None, description="next_token предыдущего ответа; без него - полная выгрузка"),
+    current_user: AuthenticatedUser = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Расписания и тренировки, изменённые после токена, и удалённые строки"""
+    lower = changes_since(since)
+    # Токен - время начала запроса: всё, что изменится дальше, попадёт в следующий ответ
+    next_token = encode_sync_token(datetime.utcnow())
+
+    schedules_query = select(*SCHEDULE_COLUMNS, models.TrainingSchedule.plan_rules).where(
+        models.TrainingSchedule.user_id == current_user.id
+    )
+    trainings_query = select(*TRAINING_COLUMNS).join(
+        models.TrainingSchedule, models.Training.schedule_id == models.TrainingSchedule.id
+    ).where(models.TrainingSchedule.user_id == current_user.id)
+    if lower is not None:
+        schedules_query = schedules_query.where(models.TrainingSchedule.updated_at > lower)
+        trainings_query = trainings_query.where(models.Training.updated_at > lower)
+
+    schedules = (await db.execute(schedules_query.order_by(models.TrainingSchedule.id))).mappings().all()
+    trainings = (await db.execute(trainings_query.order_by(models.Training.id))).mappings().all()
+    deleted = []
+    if lower is not None:
+        # При полной выгрузке удалённого просто нет в ответе
+        deleted = (await db.execute(
+            select(
+                models.SyncTombstone.entity,
+                models.SyncTombstone.entity_id.label("id"),
+                models.SyncTombstone.deleted_at,
+            ).where(
+                models.SyncTombstone.user_id == current_user.id,
+                models.SyncTombstone.deleted_at > lower
+            ).order_by(models.SyncTombstone.id)
+        )).mappings().all()
+    return {"schedules": schedules, "trainings": trainings, "deleted": deleted, "next_token": next_token}
+
+@router.post("/trainings/batch", response_model=List[schemas.TrainingStatusResult])
+async def update_training_statuses(
+    batch: schemas.TrainingStatusBatch,
+    current_user: AuthenticatedUser = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_write_db)
+):
+    """Пакетная отметка тренировок (синхронизация после офлайна) в одной транзакции"""
+    training_ids = {change.training_id for change in batch.changes}
+    # Одним запросом: какие из тренировок принадлежат расписаниям пользователя
+    result = await db.execute(
+        select(models.Training.id, models.Training.schedule_id, models.Training.date, models.Training.is_completed)
+        .join(models.TrainingSchedule, models.Training.schedule_id == models.TrainingSchedule.id)
+        .where(
+            models.Training.id.in_(training_ids),
+            models.TrainingSchedule.user_id == current_user.id
+        )
+    )
+    owned = {row.id: row for row in result}
+
+    now = datetime.utcnow()
+    updates = {}
+    results = []
+    for change in batch.changes:
+        row = owned.get(change.training_id)
+        if row is None:
+            results.append({"training_id": change.training_id, "status": "not_found"})
+            continue
+        # При повторе одного id побеждает последнее изменение
+        updates[change.training_id] = {
+            "id": change.training_id,
+            "is_completed": change.is_completed,
+            "completed_at": (change.completed_at or now) if change.is_completed else None,
+        }
+        results.append({"training_id": change.training_id, "status": "updated", "schedule_id": row.schedule_id})
+
+    if updates:
+        # ORM bulk UPDATE по первичному ключу: один executemany
+        await db.execute(update(models.Training), list(updates.values()))
+        delta = ProgressDelta()
+        for training_id, values in updates.items():
+            row = owned[training_id]
+            delta.add(current_user.id, row.date, trainings_completed=int(values["is_completed"]) - int(bool(row.is_completed)))
+        await delta.apply(db)
+        await db.commit()
+    return results
+
+async def _set_training_completed(db: AsyncSession, user_id: int, training_id: int, training_date: datetime, is_completed: bool) -> None:
+    """Условный UPDATE: агрегаты сдвигаются, только если строка действительно изменилась,
+    поэтому повтор запроса или два одновременных запроса не учитываются дважды"""
+    result = await db.execute(
+        update(models.Training)
+        .where(models.Training.id == training_id, func.coalesce(models.Training.is_completed, False) != is_completed)
+        .values(is_completed=is_completed, completed_at=datetime.utcnow() if is_completed else None)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        delta = ProgressDelta()
+        delta.add(user_id, training_date, trainings_completed=1 if is_completed else -1)
+        await delta.apply(db)
+
+async def _commit_training(db: AsyncSession) -> None:
+    """Второй тренировке того же упражнения в тот же день мешает ux_trainings_slot"""
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Тренировка этого упражнения на этот день уже есть")
 
 @router.put("/{schedule_id}/trainings/{training_id}", response_model=schemas.TrainingOut)
-def update_training_status(
+async def update_training_status(
     schedule_id: int,
     training_id: int,
     is_completed: bool = Body(...),
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: AuthenticatedUser = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_write_db)
 ):
-    schedule = db.query(models.TrainingSchedule).filter(
+    result = await db.execute(select(models.TrainingSchedule).where(
         models.TrainingSchedule.id == schedule_id,
         models.TrainingSchedule.user_id == current_user.id
-    ).first()
+    ))
+    schedule = result.scalars().first()
     if not schedule:
         raise HTTPException(status_code=404, detail="Расписание не найдено")
 
-    training = db.query(models.Training).filter(
+    result = await db.execute(select(models.Training).where(
         models.Training.id == training_id,
         models.Training.schedule_id == schedule_id
-    ).first()
+    ))
+    training = result.scalars().first()
     if not training:
         raise HTTPException(status_code=404, detail="Тренировка не найдена")
 
-    training.is_completed = is_completed
-    training.completed_at = datetime.utcnow() if is_completed else None
-    db.commit()
-    db.refresh(training)
+    await _set_training_completed(db, current_user.id, training.id, training.date, is_completed)
+    await db.commit()
+    await db.refresh(training)
     return training
 
 @router.get("/{schedule_id}/trainings", response_model=List[schemas.TrainingOut])
-def get_trainings_for_schedule(
+async def get_trainings_for_schedule(
+    schedule_id: int,
+    request: Request,
+    stream: bool = Query(False, description="Отдать NDJSON потоком (то же, что Accept: application/x-ndjson)"),
+    current_user: AuthenticatedUser = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_db)
+):
+    result = await db.execute(select(models.TrainingSchedule).where(
+        models.TrainingSchedule.id == schedule_id,
+        models.TrainingSchedule.user_id == current_user.id
+    ))
+    schedule = result.scalars().first()
+    if not schedule:
+        raise HTTPException(status_code=404, detail="Расписание не найдено")
+    if wants_ndjson(request, stream):
+        return StreamingResponse(stream_trainings_ndjson(schedule_id), media_type=NDJSON_MEDIA_TYPE)
+    result = await db.execute(select(models.Training).where(models.Training.schedule_id == schedule_id))
+    return result.scalars().all()
+
+def _planned_from_row(row) -> dict:
+    return {
+        "training_id": row.id,
+        "schedule_id": row.schedule_id,
+        "exercise_id": row.exercise_id,
+        "date": row.date,
+        "time": row.time,
+        "is_completed": row.is_completed,
+        "completed_at": row.completed_at,
+    }
+
+@router.get("/{schedule_id}/plan", response_model=List[schemas.PlannedTrainingOut])
+async def get_schedule_plan(
     schedule_id: int,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    date_from: Optional[datetime] = Query(None),
+    date_to: Optional[datetime] = Query(None),
+    current_user: AuthenticatedUser = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    schedule = db.query(models.TrainingSchedule).filter(
+    """Тренировки расписания за период; для compact-режима разворачиваются из правил"""
+    result = await db.execute(select(models.TrainingSchedule).where(
         models.TrainingSchedule.id == schedule_id,
         models.TrainingSchedule.user_id == current_user.id
-    ).first()
+    ))
+    schedule = result.scalars().first()
     if not schedule:
         raise HTTPException(status_code=404, detail="Расписание не найдено")
-    return db.query(models.Training).filter(models.Training.schedule_id == schedule_id).all()
+
+    query = select(*TRAINING_COLUMNS).where(models.Training.schedule_id == schedule_id)
+    if date_from is not None:
+        query = query.where(models.Training.date >= date_from)
+    if date_to is not None:
+        query = query.where(models.Training.date <= date_to)
+    persisted = (await db.execute(query.order_by(models.Training.date, models.Training.id))).all()
+    if schedule.mode != "compact":
+        return [_planned_from_row(row) for row in persisted]
+
+    # Сохранённые строки (выполненные и изменённые) заменяют слоты плана
+    overrides = {(row.date, row.exercise_id): row for row in persisted}
+    planned = []
+    for day, exercise_id, slot in iter_plan(schedule.plan_rules, schedule.start_date, schedule.plan_days, date_from, date_to):
+        row = overrides.pop((day, exercise_id), None)
+        if row is not None:
+            planned.append(_planned_from_row(row))
+        else:
+            planned.append({"schedule_id": schedule_id, "exercise_id": exercise_id, "date": day, "time": slot})
+    # Добавленные вручную тренировки вне правил
+    planned.extend(_planned_from_row(row) for row in overrides.values())
+    planned.sort(key=lambda item: item["date"])
+    return planned
+
+@router.put("/{schedule_id}/plan/{day}/{exercise_id}", response_model=schemas.TrainingOut)
+async def update_planned_training_status(
+    schedule_id: int,
+    day: date,
+    exercise_id: int,
+    is_completed: bool = Body(...),
+    current_user: AuthenticatedUser = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_write_db)
+):
+    """Отметка слота плана; в compact-режиме строка Training создаётся только сейчас"""
+    result = await db.execute(select(models.TrainingSchedule).where(
+        models.TrainingSchedule.id == schedule_id,
+        models.TrainingSchedule.user_id == current_user.id
+    ))
+    schedule = result.scalars().first()
+    if not schedule:
+        raise HTTPException(status_code=404, detail="Расписание не найдено")
+
+    slot_date = datetime.combine(day, datetime.min.time())
+    training_id = await db.scalar(select(models.Training.id).where(
+        models.Training.schedule_id == schedule_id,
+        models.Training.date == slot_date,
+        models.Training.exercise_id == exercise_id
+    ))
+    if training_id is None:
+        slot = None
+        if schedule.mode == "compact":
+            slot = next((
+                slot for _, planned_exercise_id, slot
+                in iter_plan(schedule.plan_rules, schedule.start_date, schedule.plan_days, slot_date, slot_date)
+                if planned_exercise_id == exercise_id
+            ), None)
+        if slot is None:
+            raise HTTPException(status_code=404, detail="Тренировка не найдена")
+        # Upsert по ux_trainings_slot: одновременные отметки слота получают одну и ту же строку
+        insert_slot = dialect_insert(models.Training).values(
+            schedule_id=schedule_id, exercise_id=exercise_id, date=slot_date, time=slot, is_completed=False
+        )
+        training_id = await db.scalar(
+            insert_slot.on_conflict_do_update(
+                index_elements=["schedule_id", "date", "exercise_id"],
+                set_={"time": insert_slot.excluded.time},
+            ).returning(models.Training.id)
+        )
+
+    await _set_training_completed(db, current_user.id, training_id, slot_date, is_completed)
+    await db.commit()
+    return await db.get(models.Training, training_id)
 
 @router.post("/{schedule_id}/trainings", response_model=schemas.TrainingOut)
-def create_training(schedule_id: int, training: schemas.TrainingCreate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    schedule = db.query(models.TrainingSchedule).filter(models.TrainingSchedule.id == schedule_id, models.TrainingSchedule.user_id == current_user.id).first()
+async def create_training(schedule_id: int, training: schemas.TrainingCreate, current_user: AuthenticatedUser = Depends(get_authenticated_user), db: AsyncSession = Depends(get_write_db)):
+    schedule = (await db.execute(select(models.TrainingSchedule).where(models.TrainingSchedule.id == schedule_id, models.TrainingSchedule.user_id == current_user.id))).scalars().first()
     if not schedule:
         raise HTTPException(status_code=404, detail="Расписание не найдено")
     db_training = models.Training(**training.dict(), schedule_id=schedule_id)
     db.add(db_training)
-    db.commit()
-    db.refresh(db_training)
+    delta = ProgressDelta()
+    delta.add_training(current_user.id, schedule, db_training)
+    await delta.apply(db)
+    await _commit_training(db)
+    await db.refresh(db_training)
     return db_training
 
 @router.put("/{schedule_id}/trainings/{training_id}", response_model=schemas.TrainingOut)
-def update_training(schedule_id: int, training_id: int, training_update: schemas.TrainingOut, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def update_training(schedule_id: int, training_id: int, training_update: schemas.TrainingOut, current_user: AuthenticatedUser = Depends(get_authenticated_user), db: AsyncSession = Depends(get_write_db)):
     # Аналогично update_training_status, но обновляйте все поля
-    training = db.query(models.Training).filter(models.Training.id == training_id, models.Training.schedule_id == schedule_id).first()
-    if not training:
+    schedule = (await db.execute(select(models.TrainingSchedule).where(models.TrainingSchedule.id == schedule_id, models.TrainingSchedule.user_id == current_user.id))).scalars().first()
+    if not schedule:
         raise HTTPException(status_code=404, detail="Расписание не найдено")
+    training = (await db.execute(select(models.Training).where(models.Training.id == training_id, models.Training.schedule_id == schedule_id))).scalars().first()
+    if not training:
+        raise HTTPException(status_code=404, detail="Тренировка не найдена")
+    delta = ProgressDelta()
+    delta.add_training(current_user.id, schedule, training, sign=-1)
     for key, value in training_update.dict(exclude_unset=True).items():
         setattr(training, key, value)
-    db.commit()
-    db.refresh(training)
+    delta.add_training(current_user.id, schedule, training)
+    await delta.apply(db)
+    await _commit_training(db)
+    await db.refresh(training)
     return training
 
 @router.delete("/{schedule_id}/trainings/{training_id}")
-def delete_training(schedule_id: int, training_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    training = db.query(models.Training).filter(models.Training.id == training_id, models.Training.schedule_id == schedule_id).first()
-    if not training:
+async def delete_training(schedule_id: int, training_id: int, current_user: AuthenticatedUser = Depends(get_authenticated_user), db: AsyncSession = Depends(get_write_db)):
+    schedule = (await db.execute(select(models.TrainingSchedule).where(models.TrainingSchedule.id == schedule_id, models.TrainingSchedule.user_id == current_user.id))).scalars().first()
+    if not schedule:
         raise HTTPException(status_code=404, detail="Расписание не найдено")
-    db.delete(training)
-    db.commit()
+    training = (await db.execute(select(models.Training).where(models.Training.id == training_id, models.Training.schedule_id == schedule_id))).scalars().first()
+    if not training:
+        raise HTTPException(status_code=404, detail="Тренировка не найдена")
+    delta = ProgressDelta()
+    delta.add_training(current_user.id, schedule, training, sign=-1)
+    await db.delete(training)
+    add_tombstone(db, current_user.id, "training", training_id)
+    await delta.apply(db)
+    await db.commit()
     return {"message": "Удалено"}
\ No newline at end of file
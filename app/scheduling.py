@@ -0,0 +1,195 @@
+import calendar
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Hashable, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+
+PLAN_DAYS = 84  # 12 недель
+FIRST_SLOT_HOUR = 9
+SLOT_MINUTES = 30
+# Для упражнений без заданной частоты
+DEFAULT_TIMES_PER_DAY = 1
+DEFAULT_DAYS_PER_WEEK = 3
+PLAN_TEMPLATE_CACHE_SIZE = int(os.getenv("PLAN_TEMPLATE_CACHE_SIZE", "256"))
+
+# (смещение дня от start_date, exercise_id, время)
+PlanTemplate = Tuple[Tuple[int, int, str], ...]
+
+
+class FrequencyRule(NamedTuple):
+    """Частота упражнения из каталога (колонки Exercise)"""
+    times_per_day: int
+    days_per_week: int
+    time_slot: Optional[str] = None  # "HH:MM"; без него время считается по слотам дня
+
+
+def frequency_rule(exercise) -> FrequencyRule:
+    return FrequencyRule(
+        exercise.times_per_day if exercise.times_per_day is not None else DEFAULT_TIMES_PER_DAY,
+        exercise.days_per_week if exercise.days_per_week is not None else DEFAULT_DAYS_PER_WEEK,
+        getattr(exercise, "time_slot", None) or None,
+    )
+
+
+def should_add_training(date: datetime, frequency: Dict[str, int]) -> bool:
+    """Перенос логики _shouldAddTraining"""
+    day_of_week = date.weekday()  # 1=Пн, 7=Вс
+    times_per_day = frequency['times_per_day']
+    days_per_week = frequency['days_per_week']
+    is_training_day = day_of_week <= days_per_week
+    return is_training_day and (date.day % (7 // times_per_day if times_per_day > 0 else 1) == 0)
+
+
+def slot_time(trainings_per_day: int) -> str:
+    """Время тренировок дня: 9:00 + 30 минут на каждую тренировку этого дня"""
+    offset = trainings_per_day * SLOT_MINUTES
+    return f"{FIRST_SLOT_HOUR + (offset // 60):02d}:{(offset % 60):02d}"
+
+
+def plan_rules(exercises: Sequence, frequency_rules: Mapping[int, FrequencyRule]) -> List[dict]:
+    """Правила плана: всё, что нужно, чтобы развернуть тренировки без каталога"""
+    rules = []
+    for exercise in exercises:
+        frequency = frequency_rules[exercise.id]
+        rule = {
+            "exercise_id": exercise.id,
+            "times_per_day": frequency.times_per_day,
+            "days_per_week": frequency.days_per_week,
+        }
+        if frequency.time_slot:
+            rule["time_slot"] = frequency.time_slot
+        rules.append(rule)
+    return rules
+
+
+def iter_plan(
+    rules: Sequence[dict],
+    start_date: datetime,
+    days: int = PLAN_DAYS,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+) -> Iterator[Tuple[datetime, int, str]]:
+    """(дата, exercise_id, время) по правилам плана, день за днём: O(дни * упражнения).
+
+    date_from/date_to ограничивают окно (включительно) внутри [start_date, start_date + days).
+    """
+    first_day = 0
+    last_day = days
+    if date_from is not None:
+        # Округляем вверх: тренировки дня приходятся на его полночь
+        offset = date_from - start_date
+        first_day = max(first_day, offset.days + (1 if offset % timedelta(days=1) else 0))
+    if date_to is not None:
+        last_day = min(last_day, (date_to - start_date).days + 1)
+    for day in range(first_day, last_day):
+        date = start_date + timedelta(days=day)
+        day_plan = [rule for rule in rules if should_add_training(date, rule)]
+        if not day_plan:
+            continue
+        time = slot_time(len(day_plan))
+        for rule in day_plan:
+            yield date, rule["exercise_id"], rule.get("time_slot") or time
+
+
+def start_date_pattern(start_date: datetime, days: int = PLAN_DAYS) -> tuple:
+    """Всё, от чего should_add_training зависит в плане: день недели и число месяца
+    каждого дня. Их задают день недели и число старта и длины месяцев на горизонте."""
+    months = []
+    year, month = start_date.year, start_date.month
+    end = start_date + timedelta(days=days)
+    while (year, month) <= (end.year, end.month):
+        months.append(calendar.monthrange(year, month)[1])
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return start_date.weekday(), start_date.day, tuple(months)
+
+
+def plan_template(rules: Sequence[dict], start_date: datetime, days: int = PLAN_DAYS) -> PlanTemplate:
+    return tuple(
+        ((date - start_date).days, exercise_id, time)
+        for date, exercise_id, time in iter_plan(rules, start_date, days)
+    )
+
+
+class PlanTemplateCache:
+    """LRU шаблонов плана: одинаковые травма, каталог и рисунок дат дают один шаблон"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, PlanTemplate]" = OrderedDict()
+        self._catalog_version: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(
+        self,
+        specific_injury: str,
+        catalog_version: int,
+        rules: Sequence[dict],
+        start_date: datetime,
+        days: int = PLAN_DAYS,
+    ) -> PlanTemplate:
+        if catalog_version != self._catalog_version:
+            # Каталог изменился: шаблоны прежней версии больше не понадобятся
+            self._entries.clear()
+            self._catalog_version = catalog_version
+        key = (specific_injury, catalog_version, days, start_date_pattern(start_date, days))
+        template = self._entries.get(key)
+        if template is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return template
+        self.misses += 1
+        template = plan_template(rules, start_date, days)
+        if self.max_entries > 0:
+            self._entries[key] = template
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return template
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "catalog_version": self._catalog_version,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+plan_templates = PlanTemplateCache(PLAN_TEMPLATE_CACHE_SIZE)
+
+
+def stamp_template(template: PlanTemplate, schedule_id: int, start_date: datetime) -> List[dict]:
+    """Строки Training по шаблону: только даты и id расписания"""
+    dates: Dict[int, datetime] = {}
+    rows = []
+    for offset, exercise_id, time in template:
+        date = dates.get(offset)
+        if date is None:
+            date = dates[offset] = start_date + timedelta(days=offset)
+        rows.append({
+            "schedule_id": schedule_id,
+            "exercise_id": exercise_id,
+            "date": date,
+            "time": time,
+            "is_completed": False,
+        })
+    return rows
+
+
+async def insert_trainings(db: AsyncSession, rows: List[dict]) -> List[models.Training]:
+    """Один пакетный INSERT ... RETURNING вместо db.add на каждую строку"""
+    if not rows:
+        return []
+    # Без sort_by_parameter_order: на SQLite без sentinel-колонки он откатывается к INSERT
+    # на каждую строку. Порядок вставки восстанавливаем по автоинкрементному id
+    result = await db.scalars(insert(models.Training).returning(models.Training), rows)
+    return sorted(result.all(), key=lambda training: training.id)
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, ConfigDict
-from typing import List, Optional, Dict
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Literal, Optional, Dict
 from datetime import datetime
 
 class UserCreate(BaseModel):
@@ -10,6 +10,18 @@ class UserOut(BaseModel):
     id: int
     username: str
 
+class TokenPair(BaseModel):
+    access_token: str
+    refresh_token: str
+    token_type: str = "bearer"
+    expires_in: int  # время жизни access-токена в секундах
+
+class LoginOut(UserOut, TokenPair):
+    pass
+
+class TokenRefresh(BaseModel):
+    refresh_token: str
+
 class QuestionnaireCreate(BaseModel):
     name: str
     gender: str
@@ -43,12 +55,15 @@ class ExerciseOut(BaseModel):
     id: int
     title: str
     general_description: str
-    injury_specific_info: Dict[str, str]
+    injury_specific_info: Optional[Dict[str, str]] = None  # есть не у всех упражнений
     suitable_for: List[str]
     max_pain_level: int
     steps: List[str]
     tags: List[str]
     image_url: Optional[str] = None
+    times_per_day: Optional[int] = None
+    days_per_week: Optional[int] = None
+    time_slot: Optional[str] = None
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -66,12 +81,47 @@ class ExerciseHistoryCreate(ExerciseHistoryBase):
 class ExerciseHistoryOut(ExerciseHistoryBase):
     id: int
     user_id: int
+    client_id: Optional[str] = None
 
     model_config = ConfigDict(from_attributes=True)
 
+class ExerciseHistoryBatchItem(ExerciseHistoryBase):
+    # Повторная отправка с тем же client_id не создаёт дубликат
+    client_id: Optional[str] = Field(None, min_length=1, max_length=64)
+
+class ExerciseHistoryBatchCreate(BaseModel):
+    user_id: int
+    items: List[ExerciseHistoryBatchItem] = Field(..., min_length=1, max_length=500)
+
+class ExerciseHistoryBatchResult(BaseModel):
+    id: int
+    client_id: str
+    status: Literal["created", "duplicate"]
+
+
+class WeeklyProgressOut(BaseModel):
+    week_start: datetime
+    trainings_planned: int
+    trainings_completed: int
+    adherence: Optional[float] = None  # доля выполненных, None если тренировок не было
+    history_entries: int
+    total_minutes: float
+    avg_pain_level: Optional[float] = None
+
+class ProgressSummaryOut(BaseModel):
+    weeks: int
+    trainings_planned: int
+    trainings_completed: int
+    adherence: Optional[float] = None
+    history_entries: int
+    total_minutes: float
+    avg_pain_level: Optional[float] = None
+    # Средняя боль последней недели с записями минус первой
+    pain_level_change: Optional[float] = None
 
 class TrainingScheduleCreate(BaseModel):
     questionnaire_id: int  # ID анкеты для генерации
+    mode: Literal["materialized", "compact"] = "materialized"
 
 class TrainingScheduleOut(BaseModel):
     id: int
@@ -81,11 +131,25 @@ class TrainingScheduleOut(BaseModel):
     specific_injury: str
     generated_at: datetime
     is_active: bool
+    mode: str = "materialized"
+    start_date: Optional[datetime] = None
+    plan_days: Optional[int] = None
+    updated_at: Optional[datetime] = None
 
     trainings: List['TrainingOut'] = []  # Вложенные тренировки 
 
     model_config = ConfigDict(from_attributes=True)
 
+class ScheduleJobOut(BaseModel):
+    id: str
+    status: Literal["queued", "running", "succeeded", "failed"]
+    progress: float
+    attempts: int
+    schedule_id: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
 class TrainingCreate(BaseModel):
     exercise_id: int
     date: datetime
@@ -100,10 +164,59 @@ class TrainingOut(BaseModel):
     time: str
     is_completed: bool
     completed_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
 
     model_config = ConfigDict(from_attributes=True)
 
+class TrainingStatusChange(BaseModel):
+    training_id: int
+    is_completed: bool
+    completed_at: Optional[datetime] = None  # время выполнения на клиенте (офлайн)
+
+class TrainingStatusBatch(BaseModel):
+    changes: List[TrainingStatusChange] = Field(..., min_length=1, max_length=1000)
+
+class TrainingStatusResult(BaseModel):
+    training_id: int
+    status: Literal["updated", "not_found"]
+    schedule_id: Optional[int] = None
+
+class PlannedTrainingOut(BaseModel):
+    """Тренировка плана; training_id есть только у сохранённых строк"""
+    training_id: Optional[int] = None
+    schedule_id: int
+    exercise_id: int
+    date: datetime
+    time: str
+    is_completed: bool = False
+    completed_at: Optional[datetime] = None
+
 # Для полного расписания 
 class FullScheduleOut(BaseModel):
     schedule: TrainingScheduleOut
-    exercises: Dict[int, str]  # exercise_id -> title (для фронта)
\ No newline at end of file
+    exercises: Dict[int, str]  # exercise_id -> title (для фронта)
+
+class ScheduleChangeOut(BaseModel):
+    id: int
+    user_id: int
+    questionnaire_id: int
+    injury_type: str
+    specific_injury: str
+    generated_at: datetime
+    is_active: bool
+    mode: str = "materialized"
+    start_date: Optional[datetime] = None
+    plan_days: Optional[int] = None
+    plan_rules: Optional[List[dict]] = None  # compact-план разворачивается на клиенте
+    updated_at: Optional[datetime] = None
+
+class DeletedEntityOut(BaseModel):
+    entity: Literal["schedule", "training"]
+    id: int
+    deleted_at: datetime
+
+class SyncChangesOut(BaseModel):
+    schedules: List[ScheduleChangeOut] = []
+    trainings: List[TrainingOut] = []
+    deleted: List[DeletedEntityOut] = []
+    next_token: str  # передаётся как since в следующем запросе
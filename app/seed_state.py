@@ -0,0 +1,41 @@
+import hashlib
+import json
+from datetime import datetime
+from typing import Optional, Union
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app import models
+from app.database import dialect_insert
+
+SCHEMA = "schema"
+EXERCISES = "exercises"
+
+Executor = Union[AsyncConnection, AsyncSession]
+
+
+def data_checksum(data) -> str:
+    """Контрольная сумма JSON-совместимых данных, не зависящая от порядка ключей"""
+    raw = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+async def read_checksum(db: Executor, name: str) -> Optional[str]:
+    return await db.scalar(select(models.SeedState.checksum).where(models.SeedState.name == name))
+
+
+async def claim(db: Executor, name: str) -> None:
+    """Блокирует строку состояния до конца транзакции: параллельно стартующие воркеры
+    ждут здесь и после перечитывания контрольной суммы не повторяют работу"""
+    stmt = dialect_insert(models.SeedState).values(name=name, checksum="")
+    stmt = stmt.on_conflict_do_update(index_elements=["name"], set_={"name": stmt.excluded.name})
+    await db.execute(stmt)
+
+
+async def store(db: Executor, name: str, checksum: str) -> None:
+    await db.execute(
+        update(models.SeedState)
+        .where(models.SeedState.name == name)
+        .values(checksum=checksum, applied_at=datetime.utcnow())
+    )
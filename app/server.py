@@ -0,0 +1,181 @@
+"""Продакшн-запуск: python -m app.server
+
+Родитель готовит БД и каталог, открывает сокет и делает fork воркеров uvicorn;
+воркеры принимают соединения с общего сокета. SIGTERM/SIGINT родителю -
+SIGTERM воркерам: они перестают принимать соединения и дорабатывают начатые
+запросы не дольше GRACEFUL_TIMEOUT секунд.
+
+Воркеры пишут снимки метрик в общий каталог (app.worker_stats): /metrics в любом
+воркере отдаёт сумму по всем, включая уже завершившиеся, а /diagnostics/* - кроме
+счётчиков своего процесса, список workers с разделом каждого живого воркера.
+"""
+import asyncio
+import logging
+import os
+import signal
+import time
+from typing import Dict
+
+import uvicorn
+from anyio import to_thread
+
+from app.passwords import hasher_pool
+from app.worker_stats import worker_stats
+
+
+def default_workers() -> int:
+    """Ядра, доступные процессу (с учётом cpuset контейнера)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "0")) or default_workers()
+# Потоки для синхронных эндпоинтов и зависимостей (по умолчанию у anyio - 40)
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "40"))
+# Больше idle-таймаута балансировщика перед сервисом, иначе он получит обрыв соединения
+KEEP_ALIVE = int(os.getenv("KEEP_ALIVE", "5"))
+GRACEFUL_TIMEOUT = float(os.getenv("GRACEFUL_TIMEOUT", "30"))
+BACKLOG = int(os.getenv("BACKLOG", "2048"))
+# Воркер, упавший раньше этого срока после запуска, перезапускается с паузой
+WORKER_RESTART_DELAY = 1.0
+
+# Под python -m __name__ == "__main__", а логи приложения настроены для "app"
+logger = logging.getLogger("app.server")
+
+
+async def preload() -> None:
+    """Схема, начальные данные и каталог - один раз в родителе, до fork.
+    Воркеры наследуют снимок каталога, а init_db в их lifespan уже ничего не меняет."""
+    from app.catalog import exercise_catalog
+    from app.database import AsyncSessionLocal, engine, init_db
+    await init_db()
+    async with AsyncSessionLocal() as db:
+        await exercise_catalog.load(db)
+    # Соединения пула не должны перейти в дочерние процессы
+    await engine.dispose()
+
+
+async def serve(server: uvicorn.Server, sock) -> None:
+    to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    await server.serve(sockets=[sock])
+
+
+class Supervisor:
+    def __init__(self, config: uvicorn.Config, workers: int):
+        self.config = config
+        self.workers = workers
+        self.sock = None
+        self.children: Dict[int, float] = {}  # pid -> время запуска
+        self.worker_ids: Dict[int, str] = {}  # pid -> id снимка метрик
+        self.spawned = 0
+        self.stopping = False
+
+    def spawn(self) -> None:
+        self.spawned += 1
+        worker_id = str(self.spawned)
+        pid = os.fork()
+        if pid == 0:
+            worker_stats.worker_id = worker_id
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                asyncio.run(serve(uvicorn.Server(self.config), self.sock))
+            except BaseException:
+                logger.exception("Worker failed")
+                code = 1
+            finally:
+                # os._exit пропускает atexit: процессы bcrypt останавливаем сами,
+                # если lifespan до этого не дошёл (после него пул уже пуст)
+                hasher_pool.shutdown()
+                os._exit(code)
+        self.children[pid] = time.monotonic()
+        self.worker_ids[pid] = worker_id
+
+    def handle_stop(self, signum, frame) -> None:
+        self.stopping = True
+
+    def reap(self) -> None:
+        for pid in list(self.children):
+            try:
+                finished, status = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                finished, status = pid, 0
+            if finished == 0:
+                continue
+            started = self.children.pop(pid)
+            self.retire(self.worker_ids.pop(pid))
+            if self.stopping:
+                continue
+            logger.warning("Worker exited, restarting", extra={"pid": pid, "exit_code": os.waitstatus_to_exitcode(status)})
+            if time.monotonic() - started < WORKER_RESTART_DELAY:
+                time.sleep(WORKER_RESTART_DELAY)
+            self.spawn()
+
+    def retire(self, worker_id: str) -> None:
+        try:
+            worker_stats.retire(worker_id)
+        except Exception:
+            logger.exception("Failed to merge metrics of exited worker", extra={"worker_id": worker_id})
+
+    def drain(self) -> None:
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + GRACEFUL_TIMEOUT + 5
+        while self.children and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in self.children:
+            logger.warning("Worker did not stop in time, killing", extra={"pid": pid})
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.children.clear()
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        self.sock = self.config.bind_socket()
+        worker_stats.prepare()
+        try:
+            for _ in range(self.workers):
+                self.spawn()
+            logger.info("Workers started", extra={"workers": self.workers, "pids": list(self.children)})
+            while not self.stopping:
+                self.reap()
+                time.sleep(0.5)
+            logger.info("Stopping workers", extra={"workers": len(self.children)})
+            self.drain()
+        finally:
+            self.sock.close()
+            worker_stats.cleanup()
+
+
+def main() -> None:
+    from app.logging_config import configure_logging, shutdown_logging
+    from app.main import app
+
+    configure_logging()
+    # Поток записи логов не переживает fork: в ребёнке логи настраивает lifespan
+    os.register_at_fork(before=shutdown_logging, after_in_parent=configure_logging)
+    asyncio.run(preload())
+
+    config = uvicorn.Config(
+        app,
+        host=HOST,
+        port=PORT,
+        timeout_keep_alive=KEEP_ALIVE,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        backlog=BACKLOG,
+    )
+    Supervisor(config, WEB_CONCURRENCY).run()
+    shutdown_logging()
+
+
+if __name__ == "__main__":
+    main()
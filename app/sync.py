@@ -0,0 +1,37 @@
+import base64
+import binascii
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+
+# Токен смещается назад на это окно: строки из транзакций, которые закоммитились
+# позже, но со временем до токена, не теряются. Клиент применяет изменения по id
+SYNC_CURSOR_OVERLAP_SECONDS = float(os.getenv("SYNC_CURSOR_OVERLAP_SECONDS", "2"))
+
+
+def encode_sync_token(moment: datetime) -> str:
+    return base64.urlsafe_b64encode(moment.isoformat().encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_sync_token(token: str) -> datetime:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode("utf-8")
+        return datetime.fromisoformat(raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Некорректный токен синхронизации")
+
+
+def changes_since(token: Optional[str]) -> Optional[datetime]:
+    """Нижняя граница updated_at/deleted_at для запроса изменений"""
+    if token is None:
+        return None
+    return decode_sync_token(token) - timedelta(seconds=SYNC_CURSOR_OVERLAP_SECONDS)
+
+
+def add_tombstone(db: AsyncSession, user_id: int, entity: str, entity_id: int) -> None:
+    db.add(models.SyncTombstone(user_id=user_id, entity=entity, entity_id=entity_id))
@@ -0,0 +1,84 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+from typing import Optional
+
+# Без AUTH_SECRET_KEY ключ генерируется на процесс: токены не переживут
+# рестарт и не будут приниматься другими воркерами
+AUTH_SECRET_KEY = os.getenv("AUTH_SECRET_KEY") or secrets.token_urlsafe(32)
+ACCESS_TOKEN_TTL_SECONDS = int(os.getenv("ACCESS_TOKEN_TTL_SECONDS", "900"))
+REFRESH_TOKEN_TTL_SECONDS = int(os.getenv("REFRESH_TOKEN_TTL_SECONDS", str(30 * 24 * 3600)))
+
+ACCESS = "access"
+REFRESH = "refresh"
+
+_secret = AUTH_SECRET_KEY.encode("utf-8")
+
+
+class TokenError(Exception):
+    pass
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(_secret, payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def password_fingerprint(password_hash: str) -> str:
+    """Короткий отпечаток хеша пароля: refresh-токен умирает после смены пароля"""
+    return hashlib.sha256(password_hash.encode("utf-8")).hexdigest()[:16]
+
+
+def issue_token(user_id: int, username: str, token_type: str, ttl_seconds: int, password_hash: Optional[str] = None) -> str:
+    claims = {
+        "sub": user_id,
+        "usr": username,
+        "typ": token_type,
+        "exp": int(time.time()) + ttl_seconds,
+    }
+    if password_hash is not None:
+        claims["pwf"] = password_fingerprint(password_hash)
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    return f"{payload}.{_sign(payload)}"
+
+
+def decode_token(token: str, expected_type: str) -> dict:
+    """Проверка подписи и срока действия; в базу не ходит"""
+    # Токен - только base64url и точка; иначе _sign и compare_digest падают с 500
+    if not token.isascii():
+        raise TokenError("Malformed token")
+    try:
+        payload, signature = token.split(".")
+    except ValueError:
+        raise TokenError("Malformed token")
+    if not hmac.compare_digest(signature, _sign(payload)):
+        raise TokenError("Invalid signature")
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        raise TokenError("Malformed token")
+    if claims.get("typ") != expected_type:
+        raise TokenError("Wrong token type")
+    if claims.get("exp", 0) < time.time():
+        raise TokenError("Token expired")
+    return claims
+
+
+def issue_token_pair(user_id: int, username: str, password_hash: str) -> dict:
+    return {
+        "access_token": issue_token(user_id, username, ACCESS, ACCESS_TOKEN_TTL_SECONDS),
+        "refresh_token": issue_token(user_id, username, REFRESH, REFRESH_TOKEN_TTL_SECONDS, password_hash),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_TTL_SECONDS,
+    }
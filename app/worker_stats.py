@@ -0,0 +1,167 @@
+"""Снимки счётчиков воркеров app.server
+
+Каждый воркер раз в WORKER_STATS_INTERVAL секунд пишет снимок своих метрик и
+разделов /diagnostics в общий каталог; /metrics, в какой бы воркер ни попал запрос,
+сводит снимки всех воркеров, а /diagnostics/* перечисляет их.
+Счётчики завершившихся воркеров супервизор переносит в dead.json, поэтому сумма
+не уменьшается при перезапуске воркера. Без app.server (uvicorn app.main:app)
+каталога нет, и обе ручки отдают счётчики своего процесса.
+"""
+import asyncio
+import glob
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.metrics import registry
+
+# Каталог снимков; по умолчанию супервизор создаёт временный. Лучше держать в tmpfs
+METRICS_DIR = os.getenv("METRICS_DIR")
+WORKER_STATS_INTERVAL = float(os.getenv("WORKER_STATS_INTERVAL", "1"))
+DEAD_FILE = "dead.json"
+
+logger = logging.getLogger(__name__)
+
+
+def _write_json(path: str, data) -> None:
+    # Запись во временный файл и os.replace: читатель видит старый или новый снимок целиком.
+    # Имя временного файла - по потоку: снимок пишут и цикл выгрузки, и /metrics
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as file:
+        json.dump(data, file, default=str)
+    os.replace(tmp, path)
+
+
+def _read_json(path: str) -> Optional[dict]:
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+class WorkerStats:
+    def __init__(self, interval: float):
+        self.interval = interval
+        # Заполняет супервизор: каталог - до fork, id - в процессе воркера
+        self.directory: Optional[str] = None
+        self.worker_id: Optional[str] = None
+        self._owns_directory = False
+        self._sections: Dict[str, Callable[[], dict]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def section(self, name: str, read: Callable[[], dict]) -> None:
+        """Раздел /diagnostics, который попадает в снимок воркера"""
+        self._sections[name] = read
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None and self.worker_id is not None
+
+    def _path(self, worker_id: str) -> str:
+        return os.path.join(self.directory, f"worker-{worker_id}.json")
+
+    def _dead_path(self) -> str:
+        return os.path.join(self.directory, DEAD_FILE)
+
+    # --- супервизор ---
+
+    def prepare(self) -> None:
+        """Пустой каталог снимков: счётчики прошлого запуска не должны попасть в сумму"""
+        if METRICS_DIR:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            for path in glob.glob(os.path.join(METRICS_DIR, "*.json")) + glob.glob(os.path.join(METRICS_DIR, "*.tmp")):
+                os.remove(path)
+            self.directory = METRICS_DIR
+        else:
+            self.directory = tempfile.mkdtemp(prefix="app-metrics-")
+            self._owns_directory = True
+
+    def retire(self, worker_id: str) -> None:
+        """Переносит счётчики и гистограммы завершившегося воркера в dead.json"""
+        path = self._path(worker_id)
+        snapshot = _read_json(path)
+        if snapshot is None:
+            return
+        dead = _read_json(self._dead_path()) or {"merged": [], "metrics": {}}
+        _write_json(self._dead_path(), {
+            "merged": dead["merged"] + [worker_id],
+            "metrics": registry.merge([dead["metrics"], snapshot["metrics"]], monotonic=True),
+        })
+        os.remove(path)
+
+    def cleanup(self) -> None:
+        if self._owns_directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    # --- воркер ---
+
+    def snapshot(self) -> dict:
+        return {
+            "id": self.worker_id,
+            "pid": os.getpid(),
+            "metrics": registry.dump(),
+            "sections": {name: read() for name, read in self._sections.items()},
+        }
+
+    def write(self) -> dict:
+        snapshot = self.snapshot()
+        _write_json(self._path(self.worker_id), snapshot)
+        return snapshot
+
+    def collect(self) -> Tuple[List[dict], Dict[str, list]]:
+        """Снимки живых воркеров (свой - свежий) и сводные счётчики завершившихся"""
+        own = self.write()
+        snapshots = {own["id"]: own}
+        for path in glob.glob(os.path.join(self.directory, "worker-*.json")):
+            snapshot = _read_json(path)
+            if snapshot is not None:
+                snapshots.setdefault(snapshot["id"], snapshot)
+        # dead.json читается последним: воркер, перенесённый туда между чтениями,
+        # отбрасывается по списку merged и не попадает в сумму дважды
+        dead = _read_json(self._dead_path()) or {"merged": [], "metrics": {}}
+        merged = set(dead["merged"])
+        live = [snapshot for worker_id, snapshot in snapshots.items() if worker_id not in merged]
+        return live, dead["metrics"]
+
+    def render_metrics(self) -> str:
+        if not self.enabled:
+            return registry.render()
+        live, dead = self.collect()
+        return registry.render(registry.merge([snapshot["metrics"] for snapshot in live] + [dead]))
+
+    def workers(self, section: str) -> List[dict]:
+        """Раздел /diagnostics каждого живого воркера"""
+        live, _ = self.collect()
+        return sorted(
+            ({"pid": snapshot["pid"], **snapshot["sections"].get(section, {})} for snapshot in live),
+            key=lambda worker: worker["pid"],
+        )
+
+    def start(self) -> None:
+        if self.enabled:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        # Последний снимок: его счётчики супервизор перенесёт в dead.json
+        self.write()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.write)
+            except Exception:
+                logger.exception("Worker stats snapshot failed")
+            await asyncio.sleep(self.interval)
+
+
+worker_stats = WorkerStats(WORKER_STATS_INTERVAL)
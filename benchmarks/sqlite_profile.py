@@ -0,0 +1,124 @@
+"""Пропускная способность SQLite с профилем "default" и "production".
+
+Читатели выбирают историю пользователя, писатели добавляют записи и сразу
+коммитят, как POST /history/. Запуск:
+
+    python -m benchmarks.sqlite_profile --seconds 5 --readers 8 --writers 2
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine
+
+from app import models
+from app.database import SQLITE_BUSY_TIMEOUT_MS, sqlite_pragmas
+
+USERS = 50
+
+
+def prepare(path: str, rows: int) -> None:
+    # Схема из моделей приложения, без прагм - как у существующего файла
+    sync_engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(sync_engine)
+    sync_engine.dispose()
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO exercise_history (user_id, exercise_name, date_time, duration, sets, pain_level) "
+        "VALUES (?, ?, ?, ?, 1, 0)",
+        [(i % USERS + 1, "bench", datetime.utcnow(), 60) for i in range(rows)],
+    )
+    conn.commit()
+    conn.close()
+
+
+def connect(path: str, profile: str) -> sqlite3.Connection:
+    # Таймаут ожидания блокировки одинаковый для обоих профилей
+    conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    for pragma in sqlite_pragmas(profile):
+        conn.execute(pragma)
+    return conn
+
+
+def run(path: str, profile: str, seconds: float, readers: int, writers: int) -> dict:
+    counters = {"reads": 0, "writes": 0, "locked": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def reader():
+        conn = connect(path, profile)
+        done = locked = 0
+        while time.perf_counter() < deadline:
+            try:
+                conn.execute(
+                    "SELECT * FROM exercise_history WHERE user_id = ? ORDER BY date_time DESC",
+                    (random.randint(1, USERS),),
+                ).fetchall()
+                done += 1
+            except sqlite3.OperationalError:
+                locked += 1
+        conn.close()
+        with lock:
+            counters["reads"] += done
+            counters["locked"] += locked
+
+    def writer():
+        conn = connect(path, profile)
+        done = locked = 0
+        while time.perf_counter() < deadline:
+            try:
+                conn.execute(
+                    "INSERT INTO exercise_history (user_id, exercise_name, date_time, duration, sets, pain_level) "
+                    "VALUES (?, 'bench', ?, 60, 1, 0)",
+                    (random.randint(1, USERS), datetime.utcnow()),
+                )
+                conn.commit()
+                done += 1
+            except sqlite3.OperationalError:
+                conn.rollback()
+                locked += 1
+        conn.close()
+        with lock:
+            counters["writes"] += done
+            counters["locked"] += locked
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        "reads_per_sec": counters["reads"] / seconds,
+        "writes_per_sec": counters["writes"] / seconds,
+        "locked_errors": counters["locked"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    for profile in ("default", "production"):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            prepare(path, args.rows)
+            result = run(path, profile, args.seconds, args.readers, args.writers)
+        print(
+            f"{profile:>10}: {result['reads_per_sec']:10.1f} reads/s "
+            f"{result['writes_per_sec']:10.1f} writes/s "
+            f"{result['locked_errors']:6d} locked"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""Миграция схемы: дубли слотов тренировок перед уникальным индексом"""
+from datetime import datetime
+
+from sqlalchemy import create_engine, inspect, insert, select, text
+
+from app import models
+from app.database import Base, apply_schema
+
+
+def test_apply_schema_removes_duplicate_training_slots():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        Base.metadata.create_all(conn)
+        # База до появления ux_trainings_slot
+        conn.execute(text("DROP INDEX ux_trainings_slot"))
+        conn.execute(insert(models.TrainingSchedule), [
+            {"id": 1, "user_id": 7, "questionnaire_id": 1, "injury_type": "x", "specific_injury": "y"},
+        ])
+        day, other_day = datetime(2026, 1, 5), datetime(2026, 1, 6)
+        conn.execute(insert(models.Training), [
+            {"id": 1, "schedule_id": 1, "exercise_id": 3, "date": day, "time": "09:00", "is_completed": False},
+            {"id": 2, "schedule_id": 1, "exercise_id": 3, "date": day, "time": "09:00", "is_completed": True},
+            {"id": 3, "schedule_id": 1, "exercise_id": 3, "date": day, "time": "09:00", "is_completed": None},
+            {"id": 4, "schedule_id": 1, "exercise_id": 3, "date": other_day, "time": "09:00", "is_completed": False},
+            {"id": 5, "schedule_id": 1, "exercise_id": 4, "date": other_day, "time": "09:30", "is_completed": False},
+            {"id": 6, "schedule_id": 1, "exercise_id": 4, "date": other_day, "time": "09:30", "is_completed": False},
+        ])
+
+        assert apply_schema(conn) == 3
+        assert conn.execute(select(models.Training.id).order_by(models.Training.id)).scalars().all() == [2, 4, 5]
+        tombstones = conn.execute(select(models.SyncTombstone.user_id, models.SyncTombstone.entity_id)).all()
+        assert sorted(tombstones) == [(7, 1), (7, 3), (7, 6)]
+        assert "ux_trainings_slot" in {index["name"] for index in inspect(conn).get_indexes("trainings")}
+        # Повторный прогон ничего не удаляет
+        assert apply_schema(conn) == 0
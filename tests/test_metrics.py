@@ -0,0 +1,48 @@
+"""Сведение снимков метрик нескольких воркеров"""
+import json
+
+from app.metrics import Counter, Gauge, Histogram, Registry
+
+
+def worker_registry(requests, latencies, pending, version):
+    registry = Registry()
+    counter = registry.register(Counter("requests_total", "Requests", ("route",)))
+    histogram = registry.register(Histogram("latency_seconds", "Latency", ("route",), (0.1, 1.0)))
+    registry.register(Gauge("pending", "Pending jobs", lambda: pending))
+    registry.register(Gauge("catalog_version", "Catalog version", lambda: version, aggregate="max"))
+    for route, amount in requests.items():
+        counter.inc((route,), amount)
+    for value in latencies:
+        histogram.observe(value, ("/a",))
+    return registry
+
+
+def test_merge_sums_counters_and_histograms():
+    first = worker_registry({"/a": 3, "/b": 1}, [0.05, 2.0], pending=2, version=1)
+    second = worker_registry({"/a": 4}, [0.5], pending=5, version=3)
+    # Снимки проходят через JSON-файлы
+    dumps = [json.loads(json.dumps(registry.dump())) for registry in (first, second)]
+    text = first.render(first.merge(dumps))
+    assert 'requests_total{route="/a"} 7' in text
+    assert 'requests_total{route="/b"} 1' in text
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{route="/a",le="1.0"} 2' in text
+    assert 'latency_seconds_count{route="/a"} 3' in text
+    assert "pending 7" in text
+    assert "catalog_version 3" in text
+
+
+def test_monotonic_merge_drops_gauges_of_exited_workers():
+    exited = worker_registry({"/a": 2}, [0.05], pending=4, version=2)
+    dead = exited.merge([exited.dump()], monotonic=True)
+    live = worker_registry({"/a": 1}, [], pending=1, version=2)
+    text = live.render(live.merge([live.dump(), dead]))
+    assert 'requests_total{route="/a"} 3' in text
+    assert 'latency_seconds_count{route="/a"} 1' in text
+    assert "pending 1" in text
+
+
+def test_local_render_has_no_worker_label():
+    text = worker_registry({"/a": 1}, [], pending=0, version=1).render()
+    assert 'requests_total{route="/a"} 1' in text
+    assert "pid=" not in text
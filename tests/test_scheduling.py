@@ -0,0 +1,171 @@
+"""План тренировок против исходного цикла генерации из POST /schedules/
+и шаблоны плана против прямого разворачивания правил"""
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.database import Base
+from app.exercise_init import initial_exercises
+from app.scheduling import (
+    PlanTemplateCache,
+    frequency_rule,
+    insert_trainings,
+    iter_plan,
+    plan_rules,
+    should_add_training,
+    stamp_template,
+)
+
+# Частоты, которые генерация брала из словаря по названию упражнения
+LEGACY_FREQUENCIES = {
+    "Изометрическое напряжение мышц": {"times_per_day": 3, "days_per_week": 7},
+    "Нейропластическая гимнастика": {"times_per_day": 2, "days_per_week": 5},
+    "Пассивная разработка сустава": {"times_per_day": 2, "days_per_week": 6},
+    "Дыхательная гимнастика": {"times_per_day": 5, "days_per_week": 7},
+    "Тренировка мелкой моторики": {"times_per_day": 2, "days_per_week": 7},
+    "Растяжка ахиллова сухожилия": {"times_per_day": 1, "days_per_week": 3},
+    "Стабилизация плечевого сустава": {"times_per_day": 2, "days_per_week": 4},
+    "Восстановление мышц живота": {"times_per_day": 3, "days_per_week": 5},
+    "Дыхание с сопротивлением": {"times_per_day": 4, "days_per_week": 7},
+    "Аквааэробика": {"times_per_day": 1, "days_per_week": 3},
+    "Баланс-терапия": {"times_per_day": 2, "days_per_week": 5},
+}
+LEGACY_DEFAULT = {"times_per_day": 1, "days_per_week": 3}
+
+
+def legacy_trainings(exercises, current_date):
+    """Исходный цикл: 84 дня, для каждого дня - проход по упражнениям"""
+    trainings = []
+    end_date = current_date + timedelta(days=84)
+    while current_date < end_date:
+        for exercise in exercises:
+            frequency = LEGACY_FREQUENCIES.get(exercise.title, LEGACY_DEFAULT)
+            if should_add_training(current_date, frequency):
+                time_offset = len([
+                    e for e in exercises
+                    if should_add_training(current_date, LEGACY_FREQUENCIES.get(e.title, LEGACY_DEFAULT))
+                ]) * 30
+                trainings.append((current_date, exercise.id, f"{9 + (time_offset // 60):02d}:{(time_offset % 60):02d}"))
+        current_date += timedelta(days=1)
+    return trainings
+
+
+def catalog_exercises():
+    """Упражнения начальных данных плюс одно без частоты (значения по умолчанию)"""
+    exercises = [
+        SimpleNamespace(
+            id=index,
+            title=data["title"],
+            times_per_day=data.get("times_per_day"),
+            days_per_week=data.get("days_per_week"),
+            time_slot=None,
+        )
+        for index, data in enumerate(initial_exercises, start=1)
+    ]
+    exercises.append(SimpleNamespace(id=99, title="Без частоты", times_per_day=None, days_per_week=None, time_slot=None))
+    return exercises
+
+
+def rules_for(exercises):
+    return plan_rules(exercises, {exercise.id: frequency_rule(exercise) for exercise in exercises})
+
+
+def start_dates(first: datetime, days: int):
+    return [first + timedelta(days=day) for day in range(days)]
+
+
+EXERCISES = catalog_exercises()
+SUBSETS = [EXERCISES, EXERCISES[:3], EXERCISES[5:6], EXERCISES[-2:]]
+
+
+@pytest.mark.parametrize("exercises", SUBSETS, ids=lambda subset: f"{len(subset)}-exercises")
+def test_iter_plan_matches_legacy_loop(exercises):
+    rules = rules_for(exercises)
+    total = 0
+    for start in start_dates(datetime(2026, 1, 1), 366):
+        expected = legacy_trainings(exercises, start)
+        assert list(iter_plan(rules, start)) == expected, start
+        total += len(expected)
+    assert total > 0
+
+
+def test_iter_plan_window_is_slice_of_full_plan():
+    rules = rules_for(EXERCISES)
+    start = datetime(2026, 3, 15)
+    date_from, date_to = start + timedelta(days=10, hours=5), start + timedelta(days=30)
+    expected = [item for item in iter_plan(rules, start) if date_from <= item[0] <= date_to]
+    assert list(iter_plan(rules, start, date_from=date_from, date_to=date_to)) == expected
+
+
+def test_time_slot_overrides_computed_time():
+    exercises = [SimpleNamespace(id=1, title="x", times_per_day=1, days_per_week=7, time_slot="18:15")]
+    plan = list(iter_plan(rules_for(exercises), datetime(2026, 1, 1)))
+    assert plan and all(time == "18:15" for _, _, time in plan)
+
+
+def test_stamped_templates_match_iter_plan():
+    """Кэш по рисунку дат не должен выдавать чужой шаблон ни для одной даты старта"""
+    rules = rules_for(EXERCISES)
+    # Без вытеснения: повторные рисунки дат должны брать шаблон из кэша
+    cache = PlanTemplateCache(4096)
+    for start in start_dates(datetime(2024, 1, 1), 3 * 366):
+        rows = stamp_template(cache.get("injury", 1, rules, start), 7, start)
+        expected = [
+            {"schedule_id": 7, "exercise_id": exercise_id, "date": date, "time": time, "is_completed": False}
+            for date, exercise_id, time in iter_plan(rules, start)
+        ]
+        assert rows == expected, start
+    assert cache.hits > 0
+
+
+def test_template_cache_is_dropped_on_new_catalog_version():
+    cache = PlanTemplateCache(8)
+    start = datetime(2026, 1, 1)
+    cache.get("injury", 1, rules_for(EXERCISES[:3]), start)
+    changed = rules_for(EXERCISES[3:6])
+    assert cache.get("injury", 2, changed, start) == tuple(
+        ((date - start).days, exercise_id, time) for date, exercise_id, time in iter_plan(changed, start)
+    )
+    assert cache.stats()["entries"] == 1
+
+
+def test_template_cache_evicts_least_recently_used():
+    cache = PlanTemplateCache(2)
+    rules = rules_for(EXERCISES)
+    for injury in ("a", "b", "a", "c"):
+        cache.get(injury, 1, rules, datetime(2026, 1, 1))
+    assert cache.stats()["entries"] == 2
+    cache.get("a", 1, rules, datetime(2026, 1, 1))
+    assert cache.hits == 2
+
+
+def test_insert_trainings_is_one_statement():
+    """Все строки плана - одним INSERT ... RETURNING, без отката к INSERT на строку"""
+
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        statements = []
+        event.listen(
+            engine.sync_engine,
+            "before_cursor_execute",
+            lambda conn, cursor, statement, *args: statements.append(statement),
+        )
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        start = datetime(2026, 1, 1)
+        rows = stamp_template(PlanTemplateCache(1).get("injury", 1, rules_for(EXERCISES), start), 1, start)
+        async with AsyncSession(engine) as db:
+            statements.clear()
+            trainings = await insert_trainings(db, rows)
+        await engine.dispose()
+        return rows, trainings, statements
+
+    rows, trainings, statements = asyncio.run(run())
+    assert len(rows) > 100
+    assert [s for s in statements if s.lstrip().upper().startswith("INSERT")] == statements
+    assert len(statements) == 1
+    assert [(t.exercise_id, t.date, t.time) for t in trainings] == [(r["exercise_id"], r["date"], r["time"]) for r in rows]